@@ -0,0 +1,170 @@
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+
+from models.segmented_sensor_log import SegmentedSensorLog
+from models.topological_compat_matrix import TopologicalCompatMatrix
+from utils.constants import BENCHMARKS_FOLDER, JSON_EXT, FILENAME_SEPARATOR, SENSOR_ID_POS, NOISE_THRESHOLD
+
+TCM_STAGE = 'tcm'
+TCM_PARALLEL_STAGE = 'tcm_parallel'
+SEGMENTATION_STAGE = 'segmentation'
+STREAMING_SEGMENTATION_STAGE = 'streaming_segmentation'
+STAGES = [TCM_STAGE, TCM_PARALLEL_STAGE, SEGMENTATION_STAGE, STREAMING_SEGMENTATION_STAGE]
+READ_CHUNK_SIZE = 1 << 24
+KB_PER_MB = 1024
+
+
+def benchmark_segmentation(path, compat_threshold, sensor_id_pos=SENSOR_ID_POS, noise_threshold=NOISE_THRESHOLD,
+                           stages=None, processes=None):
+    """
+    Measure the throughput (events per second) and the peak memory of the construction of the topological
+    compatibility matrix and of the segmentation of the given sensor log, together with the maximum number of segments
+    open at once. Each stage runs in a fresh process, so that its peak memory is not affected by the other ones.
+
+    :type path: str
+    :type compat_threshold: float
+    :type stages: list
+    :type processes: int
+    :param path: the path of the tab-separated file containing the sensor log.
+    :param compat_threshold: the threshold to reach for a direct succession to be significant.
+    :param sensor_id_pos: the position of the sensor id in the log entry.
+    :param noise_threshold: the minimum length of a segment.
+    :param stages: the stages to be measured (if None, all of them).
+    :param processes: the number of processes of the parallel stages (if None, the number of CPUs).
+    :return: a dict containing the description of the run and the results of each stage.
+    """
+    events_num = _count_lines(path)
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for stage in stages or STAGES:
+        receiver, sender = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_run_stage, args=(sender, stage, path, compat_threshold, sensor_id_pos,
+                                                       noise_threshold, processes))
+        process.start()
+        sender.close()  # the stage process holds the only sending end, so a failure cannot block the receiver
+        result = receiver.recv()
+        process.join()
+        result['events_per_sec'] = events_num / result['seconds'] if result['seconds'] else None
+        results.append(result)
+        events_per_sec = '%12.0f' % result['events_per_sec'] if result['events_per_sec'] is not None else '%12s' % 'n/a'
+        print('\t%-24s %s events/s %10.1f MB' % (stage, events_per_sec, result['peak_rss_mb']))
+
+    return {
+        'time': int(time.time()),
+        'log': os.path.abspath(path),
+        'size_bytes': os.path.getsize(path),
+        'events': events_num,
+        'parameters': {
+            'compat_threshold': compat_threshold,
+            'noise_threshold': noise_threshold,
+            'sensor_id_pos': sensor_id_pos,
+            'processes': processes or os.cpu_count(),
+        },
+        'platform': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'system': platform.system(),
+            'cpus': os.cpu_count(),
+        },
+        'stages': results,
+    }
+
+
+def dump_benchmark(results, dest=None):
+    """
+    Store the given benchmark results in a JSON file (by default, in the benchmarks folder).
+
+    :type results: dict
+    :type dest: str
+    :param results: the benchmark results.
+    :param dest: the path of the file (if None, it is named after the time of the run and the log).
+    :return: the path of the file.
+    """
+    if not dest:
+        os.makedirs(BENCHMARKS_FOLDER, exist_ok=True)
+        log_name = os.path.splitext(os.path.basename(results['log']))[0]
+        dest = os.path.join(BENCHMARKS_FOLDER, FILENAME_SEPARATOR.join([str(results['time']), log_name]) + JSON_EXT)
+    with open(dest, 'w') as dump:
+        json.dump(results, dump, indent=2)
+    return dest
+
+
+""" UTILITY FUNCTIONS """
+
+
+def _run_stage(sender, stage, path, compat_threshold, sensor_id_pos, noise_threshold, processes):
+    """
+    Measure the given stage and send the results through the given connection.
+    """
+    tcm = None
+    if stage in (SEGMENTATION_STAGE, STREAMING_SEGMENTATION_STAGE):
+        # the matrix is not part of the measure
+        tcm = TopologicalCompatMatrix.from_file(path, sensor_id_pos=sensor_id_pos)
+        tcm.get_compat_index(compat_threshold)
+
+    result = {'stage': stage, 'rss_before_mb': _get_peak_rss()}
+    start_time = time.perf_counter()
+    if stage == TCM_STAGE:
+        with open(path, 'rb') as sensor_log:
+            TopologicalCompatMatrix(sensor_log, sensor_id_pos=sensor_id_pos)
+    elif stage == TCM_PARALLEL_STAGE:
+        TopologicalCompatMatrix.from_file_parallel(path, sensor_id_pos=sensor_id_pos, processes=processes)
+    elif stage == SEGMENTATION_STAGE:
+        with open(path, 'rb') as sensor_log:
+            ssl = SegmentedSensorLog(sensor_log=sensor_log, top_compat_matrix=tcm, compat_threshold=compat_threshold,
+                                     sensor_id_pos=sensor_id_pos, noise_threshold=noise_threshold)
+        result.update(segments=len(ssl.segments), b_steps=len(ssl.b_steps),
+                      max_open_segments=ssl.max_open_segments_num)
+    elif stage == STREAMING_SEGMENTATION_STAGE:
+        with open(path, 'rb') as sensor_log:
+            ssl = SegmentedSensorLog(sensor_log=sensor_log, top_compat_matrix=tcm, compat_threshold=compat_threshold,
+                                     sensor_id_pos=sensor_id_pos, noise_threshold=noise_threshold, lazy=True)
+            b_steps_num = sum(1 for _ in ssl.iter_b_steps())
+        result.update(b_steps=b_steps_num, max_open_segments=ssl.max_open_segments_num)
+    else:
+        raise ValueError('Unknown stage: %s.' % stage)
+
+    result['seconds'] = time.perf_counter() - start_time
+    result['peak_rss_mb'] = _get_peak_rss()
+    sender.send(result)
+    sender.close()
+
+
+def _get_peak_rss():
+    """
+    Return the peak resident set size of the current process and of its terminated children (in MB).
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / KB_PER_MB
+
+
+def _count_lines(path):
+    """
+    Count the lines of the given file, reading it in chunks.
+    """
+    lines_num = 0
+    with open(path, 'rb') as f:
+        chunk = f.read(READ_CHUNK_SIZE)
+        while chunk:
+            lines_num += chunk.count(b'\n')
+            chunk = f.read(READ_CHUNK_SIZE)
+    return lines_num
+
+
+if __name__ == '__main__':
+    from utils.constants import DATA_FOLDER
+
+    SRC = os.path.join(DATA_FOLDER, 'synthetic_1000000_50_3.tsv')  # see generate_sensor_log.py
+    COMPAT_THRESHOLD_ = 0.1
+    NOISE_THRESHOLD_ = 2
+    SENSOR_ID_POS_ = 2
+
+    print('Benchmarking', SRC)
+    benchmark_results = benchmark_segmentation(SRC, COMPAT_THRESHOLD_, sensor_id_pos=SENSOR_ID_POS_,
+                                               noise_threshold=NOISE_THRESHOLD_)
+    print(dump_benchmark(benchmark_results))
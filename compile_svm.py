@@ -0,0 +1,48 @@
+import os
+from datetime import timedelta
+
+from sklearn.externals import joblib
+import time
+
+from sequence_classification.one_class_svm import LinearSpectrumScorer
+from sequence_classification.sequence_classifier_input import SequenceClassifierInput
+from utils.constants import TRAINED_MODELS_FOLDER, PICKLE_EXT, NPZ_EXT
+from utils.dataset_management import filter_dataset
+
+
+if __name__ == '__main__':
+
+    MODEL = 'l_min_15'
+    NOISE_THRESHOLD = 15
+
+    print('Loading model dump...')
+    clf = joblib.load(os.path.join(TRAINED_MODELS_FOLDER, MODEL + PICKLE_EXT))
+
+    # A svm.OneClassSVM does not store its support vectors, so the training data is needed (see train_svm.py).
+    print('Loading training data...')
+    clf_input = SequenceClassifierInput(cached_dataset='1498483802_3_17732_GOOD_training')
+    train_data, test_data, *_ = clf_input.get_spectrum_train_test_data()  # ignoring labels
+    train_data = train_data + test_data
+    filter_dataset(train_data, NOISE_THRESHOLD, clf_input.ngrams_length)
+
+    print('Compiling model...')
+    scorer = LinearSpectrumScorer.from_model(clf, train_data=train_data)
+    scorer_filename = os.path.join(TRAINED_MODELS_FOLDER, MODEL + NPZ_EXT)
+    scorer.dump(scorer_filename)
+    print('\tWeighted shingles:', len(scorer.shingles))
+    print(scorer_filename)
+
+    # The compiled model must give the same predictions of the original one.
+    print('Checking predictions on validation data...')
+    clf_input = SequenceClassifierInput(cached_dataset='1498490206_3_28519_GOOD_validation')
+    train_data, test_data, *_ = clf_input.get_spectrum_train_test_data()  # ignoring labels
+    validation_data = train_data + test_data
+    filter_dataset(validation_data, NOISE_THRESHOLD, clf_input.ngrams_length)
+
+    start_time = time.time()
+    predictions = clf.predict(validation_data)
+    print('\tModel time:', timedelta(seconds=time.time() - start_time))
+    start_time = time.time()
+    compiled_predictions = scorer.predict(validation_data)
+    print('\tCompiled model time:', timedelta(seconds=time.time() - start_time))
+    print('\tDifferent predictions:', int((predictions != compiled_predictions).sum()))
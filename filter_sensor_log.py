@@ -1,8 +1,7 @@
 import os
 
-import unicodecsv as csv
-
-from utils.constants import DATA_FOLDER, LOG_EXT, LOG_ENTRY_DELIMITER, SENSOR_STATE_POS, SENSOR_STATE_ON
+from utils.constants import DATA_FOLDER, LOG_EXT
+from utils.pipeline import FilterStateStage, CsvWriterStage, run_pipeline
 
 
 def filter_sensor_log(sensor_log):
@@ -13,16 +12,9 @@ def filter_sensor_log(sensor_log):
     :param sensor_log: the tab-separated file containing the sensor log.
     """
     dest = os.path.splitext(sensor_log.name)[0] + '_filtered' + LOG_EXT
-    src_reader = csv.reader(sensor_log, delimiter=LOG_ENTRY_DELIMITER)
-
-    with open(dest, 'wb') as filtered_log:
-        dest_writer = csv.writer(filtered_log, delimiter=LOG_ENTRY_DELIMITER)
-
-        entry = next(src_reader, None)
-        while entry is not None:
-            if entry[SENSOR_STATE_POS] == SENSOR_STATE_ON:
-                dest_writer.writerow(entry)
-            entry = next(src_reader, None)
+    root = FilterStateStage()
+    root.then(CsvWriterStage(dest))
+    run_pipeline(sensor_log, root)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+from utils.constants import DATA_FOLDER, LOG_EXT, LOG_ENTRY_DELIMITER, SENSOR_STATE_ON
+
+SECONDS_PER_DAY = 24 * 60 * 60
+SENSOR_NEIGHBOURS_NUM = 3
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def generate_sensor_log(dest, events_num, sensors_num=30, users_num=2, interleaving_rate=0.3, noise_rate=0.05,
+                        routine_length=(5, 30), mean_gap=20., idle_rate=0.001, seed=None, start=datetime(2016, 11, 9)):
+    """
+    Write a synthetic sensor log with the same layout of the real ones (i.e. date, time, sensor id and state).
+    Sensors are the nodes of a random graph, where each sensor is connected with a few neighbours (e.g. the ones in
+    the same room). Each user performs routines, i.e. random walks over the graph of random length, and the events of
+    concurrent users are interleaved. A fraction of the events are noise, i.e. random sensors.
+    The log is written incrementally, so that its size is not bounded by memory.
+
+    :type dest: str
+    :type events_num: int
+    :type sensors_num: int
+    :type users_num: int
+    :type interleaving_rate: float
+    :type noise_rate: float
+    :type routine_length: tuple
+    :type mean_gap: float
+    :type idle_rate: float
+    :type start: datetime
+    :param dest: the path of the log to be written.
+    :param events_num: the number of events.
+    :param sensors_num: the number of sensors.
+    :param users_num: the number of concurrent users.
+    :param interleaving_rate: the probability that an event is generated by a different user from the previous one.
+    :param noise_rate: the probability that an event is noise.
+    :param routine_length: the minimum and maximum number of events of a routine.
+    :param mean_gap: the mean time gap between consecutive events (in seconds).
+    :param idle_rate: the probability that a long time gap (i.e. up to some hours) follows an event.
+    :param seed: the seed of the random numbers generator (for reproducibility).
+    :param start: the timestamp of the first event.
+    """
+    rnd = random.Random(seed)
+    sensors = ['Sensor%04d' % i for i in range(sensors_num)]
+    neighbours = [rnd.sample(range(sensors_num), min(SENSOR_NEIGHBOURS_NUM, sensors_num)) for _ in sensors]
+
+    # the current sensor and the events left in the current routine of each user
+    positions = [rnd.randrange(sensors_num) for _ in range(users_num)]
+    routines_left = [rnd.randint(*routine_length) for _ in range(users_num)]
+    user = 0
+
+    day = start.date()
+    seconds = (start - datetime.combine(day, datetime.min.time())).total_seconds()
+    date_str = day.isoformat()
+    line_format = LOG_ENTRY_DELIMITER.join(['%s', '%02d:%02d:%02d.%06d', '%s', SENSOR_STATE_ON]) + '\n'
+
+    with open(dest, 'w', buffering=WRITE_BUFFER_SIZE) as sensor_log:
+        for _ in range(events_num):
+            if users_num > 1 and rnd.random() < interleaving_rate:
+                user = (user + rnd.randrange(1, users_num)) % users_num
+
+            if rnd.random() < noise_rate:
+                sensor = rnd.randrange(sensors_num)
+            else:
+                if routines_left[user]:
+                    routines_left[user] -= 1
+                    positions[user] = rnd.choice(neighbours[positions[user]])
+                else:
+                    # start a new routine somewhere else
+                    routines_left[user] = rnd.randint(*routine_length)
+                    positions[user] = rnd.randrange(sensors_num)
+                sensor = positions[user]
+
+            seconds += rnd.expovariate(1. / mean_gap)
+            if rnd.random() < idle_rate:
+                seconds += rnd.uniform(SECONDS_PER_DAY / 24, SECONDS_PER_DAY / 3)
+            if seconds >= SECONDS_PER_DAY:
+                days, seconds = divmod(seconds, SECONDS_PER_DAY)
+                day += timedelta(days=days)
+                date_str = day.isoformat()
+
+            whole_seconds = int(seconds)
+            sensor_log.write(line_format % (date_str, whole_seconds // 3600, whole_seconds // 60 % 60,
+                                            whole_seconds % 60, int((seconds - whole_seconds) * 1e6),
+                                            sensors[sensor]))
+
+
+if __name__ == '__main__':
+    import time
+
+    EVENTS_NUM = 1000000
+    SENSORS_NUM = 50
+    USERS_NUM = 3
+    DEST = os.path.join(DATA_FOLDER, 'synthetic_%d_%d_%d' % (EVENTS_NUM, SENSORS_NUM, USERS_NUM) + LOG_EXT)
+
+    start_time = time.time()
+    generate_sensor_log(DEST, EVENTS_NUM, sensors_num=SENSORS_NUM, users_num=USERS_NUM, seed=42)
+    print(DEST)
+    print('Generation time:', timedelta(seconds=time.time() - start_time))
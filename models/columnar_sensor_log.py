@@ -0,0 +1,202 @@
+import json
+import os
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils.constants import DATE_POS, TIME_POS, SENSOR_ID_POS, SENSOR_STATE_POS, LOG_ENTRY_DELIMITER, COLUMNAR_EXT, \
+    NPY_EXT, JSON_EXT
+from utils.files import iter_entries_with_offsets
+
+
+class ColumnarSensorLog(object):
+    TIMESTAMPS_COLUMN = 'timestamps'
+    CODES_COLUMN = 'codes'
+    STATES_COLUMN = 'states'
+    OFFSETS_COLUMN = 'offsets'
+    ANNOTATION_OFFSETS_COLUMN = 'annotation_offsets'
+    ANNOTATION_VALUES_COLUMN = 'annotation_values'
+    DICTIONARY = 'dictionary'
+    EPOCH = datetime(1970, 1, 1)
+    PARSE_CHUNK_SIZE = 1 << 16
+    EVENTS_CHUNK_SIZE = 1 << 16
+
+    def __init__(self, path):
+        """
+        Memory-mapped columnar version of a sensor log (see from_tsv()), s.t. it can be analysed many times without
+        parsing the text again. Each column is a binary array mapped in memory, so that opening the log costs nothing
+        and only the pages actually accessed are read:
+        - timestamps: the microseconds since the epoch of each event (int64);
+        - codes: the code of the sensor of each event (uint16, or uint32 if there are too many sensors), the position
+          of each sensor id in the sensors list is its code;
+        - states: the code of the state of each event (uint8), the position of each state in the states list is its
+          code;
+        - offsets: the byte offset of each event in the original tab-separated log (int64), so that segments are the
+          same of the ones found in the original log;
+        - annotations: the fields following the state (e.g. activity labels), stored as the concatenation of their
+          UTF-8 encodings (annotation_values) and the offset where each of them starts (annotation_offsets, with one
+          more item marking the end of the last one).
+        The sensors, the states and the path of the original log are stored in a JSON dictionary.
+
+        :type path: str
+        :param path: the path of the folder containing the columns.
+        """
+        self.path = path
+        with open(os.path.join(path, self.DICTIONARY + JSON_EXT)) as dictionary_file:
+            dictionary = json.load(dictionary_file)
+        self.name = dictionary['source']  # the original log (see SegmentedSensorLog.get_rows())
+        self.sensors = dictionary['sensors']
+        self.states = dictionary['states']
+
+        self.timestamps = self._load_column(self.TIMESTAMPS_COLUMN)
+        self.codes = self._load_column(self.CODES_COLUMN)
+        self.state_codes = self._load_column(self.STATES_COLUMN)
+        self.offsets = self._load_column(self.OFFSETS_COLUMN)
+        self._annotation_offsets = self._load_column(self.ANNOTATION_OFFSETS_COLUMN)
+        self._annotation_values = self._load_column(self.ANNOTATION_VALUES_COLUMN)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getstate__(self):
+        # the columns are mapped again when unpickling (e.g. in a worker process), instead of being copied
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @classmethod
+    def from_tsv(cls, sensor_log, dest=None, date_pos=DATE_POS, time_pos=TIME_POS, sensor_id_pos=SENSOR_ID_POS,
+                 state_pos=SENSOR_STATE_POS):
+        """
+        Convert the given sensor log to the columnar format, parsing it once. The fields following the state are
+        stored as the annotation of each event.
+
+        :type sensor_log: file
+        :type dest: str
+        :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode).
+        :param dest: the path of the folder where the columns are written (if None, the name of the log is used).
+        :param date_pos: the position of the date in the log entry.
+        :param time_pos: the position of the time in the log entry.
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param state_pos: the position of the sensor state in the log entry.
+        :return: the columnar sensor log.
+        """
+        dest = dest or os.path.splitext(sensor_log.name)[0] + COLUMNAR_EXT
+        annotation_pos = max(date_pos, time_pos, sensor_id_pos, state_pos) + 1
+
+        sensor_codes = {}
+        state_codes = {}
+        timestamps = array('q')
+        codes = array('I')
+        states = array('B')
+        offsets = array('q')
+        annotation_offsets = array('q', [0])
+        annotation_values = bytearray()
+        date_times = []
+
+        for offset, entry in iter_entries_with_offsets(sensor_log):
+            sensor_id = entry[sensor_id_pos]
+            try:
+                code = sensor_codes[sensor_id]
+            except KeyError:
+                code = sensor_codes[sensor_id] = len(sensor_codes)
+            state = entry[state_pos]
+            try:
+                state_code = state_codes[state]
+            except KeyError:
+                state_code = state_codes[state] = len(state_codes)
+
+            codes.append(code)
+            states.append(state_code)
+            offsets.append(offset)
+            annotation_values += LOG_ENTRY_DELIMITER.join(entry[annotation_pos:]).encode()
+            annotation_offsets.append(len(annotation_values))
+
+            # timestamps are parsed in chunks, at once
+            date_times.append(entry[date_pos] + ' ' + entry[time_pos])
+            if len(date_times) == cls.PARSE_CHUNK_SIZE:
+                timestamps.frombytes(np.array(date_times, dtype='datetime64[us]').view(np.int64).tobytes())
+                date_times.clear()
+        timestamps.frombytes(np.array(date_times, dtype='datetime64[us]').view(np.int64).tobytes())
+
+        os.makedirs(dest, exist_ok=True)
+        codes_type = np.uint16 if len(sensor_codes) <= np.iinfo(np.uint16).max + 1 else np.uint32
+        columns = {
+            cls.TIMESTAMPS_COLUMN: np.frombuffer(timestamps, dtype=np.int64),
+            cls.CODES_COLUMN: np.frombuffer(codes, dtype=np.uint32).astype(codes_type),
+            cls.STATES_COLUMN: np.frombuffer(states, dtype=np.uint8),
+            cls.OFFSETS_COLUMN: np.frombuffer(offsets, dtype=np.int64),
+            cls.ANNOTATION_OFFSETS_COLUMN: np.frombuffer(annotation_offsets, dtype=np.int64),
+            cls.ANNOTATION_VALUES_COLUMN: np.frombuffer(annotation_values, dtype=np.uint8),
+        }
+        for column, values in columns.items():
+            np.save(os.path.join(dest, column + NPY_EXT), values)
+
+        # the dictionary is written last, so that a partial conversion cannot be opened
+        with open(os.path.join(dest, cls.DICTIONARY + JSON_EXT), 'w') as dictionary_file:
+            json.dump({
+                'source': os.path.abspath(sensor_log.name),
+                'sensors': list(sensor_codes),
+                'states': list(state_codes),
+            }, dictionary_file)
+        return cls(dest)
+
+    def get_annotation(self, i):
+        """
+        Return the annotation of the given event, i.e. the fields following the state.
+
+        :type i: int
+        :param i: the position of the event in the log.
+        :return: the list of fields (empty if the event has no annotation).
+        """
+        start, end = self._annotation_offsets[i:i + 2].tolist()
+        if start == end:
+            return []
+        return self._annotation_values[start:end].tobytes().decode().split(LOG_ENTRY_DELIMITER)
+
+    def get_datetime(self, i):
+        """
+        Return the timestamp of the given event.
+
+        :type i: int
+        :param i: the position of the event in the log.
+        :return: the datetime of the event.
+        """
+        return self.to_datetime(int(self.timestamps[i]))
+
+    @classmethod
+    def to_datetime(cls, timestamp):
+        """
+        Convert the given timestamp (as stored in the timestamps column) to a datetime.
+
+        :type timestamp: int
+        :param timestamp: the microseconds since the epoch.
+        :return: the datetime.
+        """
+        return cls.EPOCH + timedelta(microseconds=timestamp)
+
+    def iter_events(self):
+        """
+        Iterate over the events of the log, reading the columns in chunks.
+
+        :return: a generator of tuples made of the byte offset in the original log, the sensor code and the timestamp
+        (see to_datetime()) of each event.
+        """
+        for start in range(0, len(self), self.EVENTS_CHUNK_SIZE):
+            end = start + self.EVENTS_CHUNK_SIZE
+            yield from zip(self.offsets[start:end].tolist(), self.codes[start:end].tolist(),
+                           self.timestamps[start:end].tolist())
+
+    """ UTILITY FUNCTIONS """
+
+    def _load_column(self, column):
+        """
+        Map the given column in memory (read-only).
+
+        :type column: str
+        :param column: the name of the column.
+        :return: the array of the column values.
+        """
+        return np.load(os.path.join(self.path, column + NPY_EXT), mmap_mode='r')
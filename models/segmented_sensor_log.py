@@ -1,29 +1,182 @@
+import json
+import multiprocessing
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import datetime
+from operator import itemgetter
+from statistics import median
+
 import matplotlib.pyplot as plt
 import seaborn as sn
 import unicodecsv as csv
 
+from models.columnar_sensor_log import ColumnarSensorLog
 from models.topological_compat_matrix import TopologicalCompatMatrix
-from utils.constants import LOG_ENTRY_DELIMITER, SENSOR_ID_POS, NOISE_THRESHOLD
+from utils.constants import LOG_ENTRY_DELIMITER, SENSOR_ID_POS, NOISE_THRESHOLD, DATE_POS, TIME_POS
+from utils.files import iter_entries_with_offsets
+
+
+class Segment(object):
+    __slots__ = ('offsets', 'codes')
+
+    def __init__(self):
+        """
+        Compact representation of a segment, made of the byte offsets of its measures in the sensor log and the codes
+        of their sensors (see SegmentedSensorLog.get_sensor_ids() and SegmentedSensorLog.get_rows()).
+        """
+        self.offsets = array('q')  # the byte offsets of the measures in the sensor log.
+        self.codes = array('I')    # the codes of the sensors of the measures.
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, offset, code):
+        self.offsets.append(offset)
+        self.codes.append(code)
+
+
+class SensorLogEvents(object):
+    __slots__ = ('name', 'sensors', 'offsets', 'codes', 'timestamps')
+
+    def __init__(self, sensor_log, sensor_id_pos=SENSOR_ID_POS):
+        """
+        The events of the given sensor log, parsed once to be shared by many segmentations (see sweep_thresholds()).
+        Each event is made of the byte offset of its entry in the log and the code of its sensor.
+
+        :type sensor_log: file
+        :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode).
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        """
+        self.name = getattr(sensor_log, 'name', None)
+        self.sensors = []          # the sensor ids found in the log, the position of each id is its code.
+        self.offsets = array('q')  # the byte offsets of the events in the sensor log.
+        self.codes = array('I')    # the codes of the sensors of the events.
+        self.timestamps = None     # the timestamps are not parsed.
+
+        sensor_codes = {}
+        for offset, entry in iter_entries_with_offsets(sensor_log):
+            sensor_id = entry[sensor_id_pos]
+            try:
+                code = sensor_codes[sensor_id]
+            except KeyError:
+                code = sensor_codes[sensor_id] = len(self.sensors)
+                self.sensors.append(sensor_id)
+            self.offsets.append(offset)
+            self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def iter_events(self):
+        """
+        Iterate over the events of the log (see ColumnarSensorLog.iter_events()).
+
+        :return: a generator of tuples made of the byte offset, the sensor code and the timestamp (None) of each event.
+        """
+        for offset, code in zip(self.offsets, self.codes):
+            yield offset, code, None
 
 
 class BStep(object):
+    __slots__ = ('closed_segments', 'compat_segments', 'closed_sensors', 'open_compat_num')
+
     def __init__(self):
         """
         Gather the two sets of segments that must be combined to contribute to the validation set.
         """
-        self.closed_segments = []  # the segments closed at this B-step.
-        self.compat_segments = []  # the segments opened between this B-step and the next that are compatible.
+        self.closed_segments = []      # the segments closed at this B-step.
+        self.compat_segments = []      # the segments opened between this B-step and the next that are compatible.
+        self.closed_sensors = set()    # the sensor ids of the last measures of the segments closed at this B-step.
+        self.open_compat_num = 0       # the number of compatible segments that are still open.
 
-    def add_closed_segment(self, s):
+    def add_closed_segment(self, s, last_sensor_id):
         self.closed_segments.append(s)
+        self.closed_sensors.add(last_sensor_id)
 
     def add_compat_segment(self, s):
         self.compat_segments.append(s)
 
 
+class SegmentationStats(object):
+    __slots__ = ('events_num', 'compat_checks_num', 'b_steps_num', 'closed_segments_num', 'noise_segments_num',
+                 'idle_segments_num', 'max_open_segments_num', 'open_segments_samples', 'seconds', 'sampling_interval')
+    KILO = 1000
+
+    def __init__(self, sampling_interval=1000):
+        """
+        Counters collected while segmenting a sensor log, to understand where the time goes (see
+        SegmentedSensorLog(collect_stats=True)).
+
+        :type sampling_interval: int
+        :param sampling_interval: the number of events between two samples of the number of open segments.
+        """
+        self.events_num = 0               # the events segmented.
+        self.compat_checks_num = 0        # the membership tests between open segments and compatible predecessors.
+        self.b_steps_num = 0              # the B-steps performed.
+        self.closed_segments_num = 0      # the segments closed, including the ones dropped as noise.
+        self.noise_segments_num = 0       # the segments dropped by the noise threshold.
+        self.idle_segments_num = 0        # the segments closed because idle (see max_idle).
+        self.max_open_segments_num = 0    # the maximum number of segments open at once.
+        self.open_segments_samples = []   # the number of events and of open segments, every sampling interval.
+        self.seconds = 0.                 # the time spent segmenting.
+        self.sampling_interval = sampling_interval
+
+    @property
+    def b_steps_per_kilo_event(self):
+        """
+        The number of B-steps performed every 1000 events.
+
+        :rtype: float
+        """
+        return self.KILO * self.b_steps_num / self.events_num if self.events_num else 0.
+
+    def add_measure(self, compat_checks_num, open_segments_num):
+        """
+        Count a segmented event.
+
+        :type compat_checks_num: int
+        :type open_segments_num: int
+        :param compat_checks_num: the compatibility checks performed to segment the event.
+        :param open_segments_num: the number of open segments after the event has been segmented.
+        """
+        self.events_num += 1
+        self.compat_checks_num += compat_checks_num
+        if open_segments_num > self.max_open_segments_num:
+            self.max_open_segments_num = open_segments_num
+        if not self.events_num % self.sampling_interval:
+            self.open_segments_samples.append((self.events_num, open_segments_num))
+
+    def to_dict(self):
+        """
+        Return the statistics as a dict (e.g. to be exported to JSON).
+
+        :return: a dict containing the statistics.
+        """
+        stats = {attr: getattr(self, attr) for attr in self.__slots__}
+        stats['b_steps_per_kilo_event'] = self.b_steps_per_kilo_event
+        stats['events_per_sec'] = self.events_num / self.seconds if self.seconds else None
+        return stats
+
+    def dump(self, path):
+        """
+        Store the statistics in the given JSON file.
+
+        :type path: str
+        :param path: the path of the file.
+        """
+        with open(path, 'w') as dump:
+            json.dump(self.to_dict(), dump, indent=2)
+
+
 class SegmentedSensorLog(object):
+    PARTITIONS_PER_PROCESS = 4
+
     def __init__(self, sensor_log=None, top_compat_matrix=None, compat_threshold=None, segments=None,
-                 sensor_id_pos=SENSOR_ID_POS, noise_threshold=NOISE_THRESHOLD):
+                 sensor_id_pos=SENSOR_ID_POS, noise_threshold=NOISE_THRESHOLD, update_matrix=False, lazy=False,
+                 events=None, max_idle=None, date_pos=DATE_POS, time_pos=TIME_POS, collect_stats=False):
         """
         Segmented version of the given log, built according to the given probabilistic topological compatibility matrix.
         
@@ -33,30 +186,173 @@ class SegmentedSensorLog(object):
         :type segments: list
         :type sensor_id_pos: int
         :type noise_threshold: int
+        :type update_matrix: bool
+        :type lazy: bool
+        :type events: SensorLogEvents | ColumnarSensorLog
+        :type max_idle: datetime.timedelta
+        :type collect_stats: bool
         :param sensor_log: the tab-separated file containing the sensor log.
         :param top_compat_matrix: the topological compatibility matrix of the sensor log.
         :param compat_threshold: the threshold to reach for a direct succession to be significant.
         :param segments: a precomputed list of segments.
         :param sensor_id_pos: the position of the sensor id in the log entry.
         :param noise_threshold: the minimum length of a segment.
+        :param update_matrix: whether each measure has to be added to the topological compatibility matrix before being
+        segmented (e.g. to segment against a sliding-window matrix that tracks the recent behaviour).
+        :param lazy: whether the segmentation has to be performed only while iterating over segments or B-steps (see
+        iter_segments() and iter_b_steps()), without storing them. The sensor log must be kept open meanwhile. If
+        neither the sensor log nor the events are provided, the entries are segmented as they are added instead (see
+        add_entry()).
+        :param events: the already parsed events of the sensor log (or its columnar version), to be segmented instead of
+        reading the sensor log. The events are shared, so the topological compatibility matrix cannot be updated
+        meanwhile.
+        :param max_idle: the maximum time span without measures for a segment to be kept open (if None, segments are
+        closed only at B-steps). Segments closed this way are filtered as usual, but they do not form a B-step.
+        :param date_pos: the position of the date in the log entry (used only if max_idle is set and the events are not
+        provided).
+        :param time_pos: the position of the time in the log entry (used only if max_idle is set and the events are not
+        provided).
+        :param collect_stats: whether the statistics of the segmentation have to be collected (see stats). When they
+        are not, the cost is a single test per event.
         """
         if segments:
             self.segments = segments
 
-        elif sensor_log and top_compat_matrix and compat_threshold:
+        elif (sensor_log or events is not None or lazy) and top_compat_matrix and compat_threshold:
+            if events is not None and update_matrix:
+                raise ValueError('The matrix cannot be updated while segmenting shared events.')
+            if events is not None and max_idle and events.timestamps is None:
+                raise ValueError('Shared events have no timestamps, segments cannot be closed when idle.')
+
             self.segments = []
             self.top_compat_matrix = top_compat_matrix
             self.compat_threshold = compat_threshold
             self.noise_threshold = noise_threshold
             self.sensor_id_pos = sensor_id_pos
+            self.update_matrix = update_matrix
+            self.max_idle = max_idle
+            self.date_pos = date_pos
+            self.time_pos = time_pos
 
             self.b_steps = []  # the B-steps performed during the segmentation (to be used in validation).
+            self.max_open_segments_num = 0  # the maximum number of segments open at once during the segmentation.
+            self.stats = SegmentationStats() if collect_stats else None
+            self.sensors = []  # the sensor ids found in the log, the position of each id is its code in segments.
+            self._sensor_codes = {}
 
-            self._find_segments(sensor_log)
+            # the compatible predecessors of each sensor, according to the threshold
+            self._compat_index = top_compat_matrix.get_compat_index(compat_threshold)
+
+            self._sensor_log = sensor_log
+            self._sensor_log_name = getattr(sensor_log, 'name', None)
+            self._events = events
+            if events is not None:
+                self.sensors = events.sensors  # shared with other segmentations, it is never extended
+                self._sensor_log_name = events.name
+
+            # the open segments, grouped by last sensor id and keyed by the byte offset of their first measure (which
+            # follows the opening order)
+            self._open_segments = {}
+            self._last_b_step = None
+            self._compat_b_steps = {}  # the B-step each open compatible segment belongs to, by first measure offset.
+            # the last sensor id and the timestamp of the last measure of each open segment, from the least recent one
+            # (used only if max_idle is set)
+            self._last_measures = OrderedDict()
+            self._open_segments_num = 0
+
+            if not lazy:
+                self._find_segments()
 
         else:
             raise ValueError('Not enough inputs provided.')
 
+    @classmethod
+    def from_file_parallel(cls, path, top_compat_matrix, compat_threshold, sensor_id_pos=SENSOR_ID_POS,
+                           noise_threshold=NOISE_THRESHOLD, processes=None, max_gap=None, date_pos=DATE_POS,
+                           time_pos=TIME_POS):
+        """
+        Segment the given sensor log using a pool of processes. The log is split into partitions made of whole days
+        (or separated by a time gap longer than the given one) and each partition is segmented separately against the
+        shared topological compatibility matrix, starting with no open segments.
+        The partitions are then stitched in order: the segmentation of each partition is resumed from the segments
+        still open at its start, until it reaches the same state of the separate segmentation, whose results are taken
+        from then on (if the states never match, the whole partition is segmented again). The result is identical to
+        the one of the sequential segmentation.
+
+        :type path: str
+        :type top_compat_matrix: TopologicalCompatMatrix
+        :type compat_threshold: float
+        :type noise_threshold: int
+        :type processes: int
+        :type max_gap: datetime.timedelta
+        :param path: the path of the tab-separated file containing the sensor log.
+        :param top_compat_matrix: the topological compatibility matrix of the sensor log.
+        :param compat_threshold: the threshold to reach for a direct succession to be significant.
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param noise_threshold: the minimum length of a segment.
+        :param processes: the number of processes (if None, the number of CPUs).
+        :param max_gap: the minimum time gap between two partitions (if None, partitions are split by date).
+        :param date_pos: the position of the date in the log entry.
+        :param time_pos: the position of the time in the log entry (used only if max_gap is set).
+        :return: the segmented sensor log.
+        """
+        processes = processes or os.cpu_count()
+        partitions_num = processes * cls.PARTITIONS_PER_PROCESS
+        size = os.path.getsize(path)
+        with open(path, 'rb') as sensor_log:
+            bounds = sorted(set([_find_partition_start(sensor_log, size * i // partitions_num, max_gap, date_pos,
+                                                       time_pos) for i in range(partitions_num)] + [size]))
+        ranges = list(zip(bounds[:-1], bounds[1:]))
+
+        top_compat_matrix.get_compat_index(compat_threshold)  # compute the index before sharing the matrix
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(top_compat_matrix,)) as pool:
+            partitions = pool.starmap(_segment_partition, [(path, start, end, compat_threshold, sensor_id_pos,
+                                                            noise_threshold) for start, end in ranges])
+
+        with open(path, 'rb') as sensor_log:
+            ssl = cls(sensor_log=sensor_log, top_compat_matrix=top_compat_matrix, compat_threshold=compat_threshold,
+                      sensor_id_pos=sensor_id_pos, noise_threshold=noise_threshold, lazy=True)
+            ssl._use_matrix_codes()
+            for (start, end), partition in zip(ranges, partitions):
+                ssl._stitch_partition(sensor_log, start, end, *partition)
+            ssl._add_result(ssl._close_remaining_segments())
+        return ssl
+
+    def get_sensor_ids(self, segment):
+        """
+        Return the sensor ids of the measures in the given segment.
+
+        :type segment: Segment
+        :param segment: the segment.
+        :return: the list of sensor ids.
+        """
+        return [self.sensors[code] for code in segment.codes]
+
+    def get_sequence(self, segment):
+        """
+        Return the sequence of symbols corresponding to the given segment, i.e. the concatenation of its sensor ids.
+
+        :type segment: Segment
+        :param segment: the segment.
+        :return: the string representing the segment.
+        """
+        return ''.join([self.sensors[code] for code in segment.codes])
+
+    def get_rows(self, segment):
+        """
+        Materialize the full log entries of the measures in the given segment, reading them from the sensor log file.
+
+        :type segment: Segment
+        :param segment: the segment.
+        :return: the list of log entries.
+        """
+        with open(self._sensor_log_name, 'rb') as sensor_log:
+            lines = []
+            for offset in segment.offsets:
+                sensor_log.seek(offset)
+                lines.append(sensor_log.readline())
+        return list(csv.reader(lines, delimiter=LOG_ENTRY_DELIMITER))
+
     def plot_stats(self, distribution=True, time_series=False):
         """
         Visualize segmented sensor log statistics.
@@ -84,93 +380,453 @@ class SegmentedSensorLog(object):
 
         plt.show()
 
+    def iter_segments(self):
+        """
+        Segment the sensor log, yielding each segment (if the minimum length is matched) as soon as it is closed.
+        Segments are not stored, so that memory depends only on the number of open segments.
+
+        :return: a generator of segments.
+        """
+        for closed_segments, _, _ in self._iter_segmentation():
+            yield from closed_segments
+
+    def iter_b_steps(self):
+        """
+        Segment the sensor log, yielding each B-step as soon as it is complete, i.e. when the following B-step has been
+        performed and all its compatible segments have been closed. Notice that B-steps are yielded in order of
+        completion and they are not stored.
+
+        :return: a generator of B-steps.
+        """
+        for _, _, completed_b_steps in self._iter_segmentation():
+            yield from completed_b_steps
+
+    def add_entry(self, entry, offset):
+        """
+        Segment the given log entry, assuming that it follows the ones already segmented (e.g. when the entries come
+        from a live source instead of a file, see segmentation_service.py). Segments are not stored.
+
+        :type entry: list
+        :type offset: int
+        :param entry: the log entry.
+        :param offset: the identifier of the entry, greater than the ones of the previous entries (e.g. its position in
+        the stream). It takes the place of the byte offset in the segments, so get_rows() cannot be used.
+        :return: the list of results of closing segments meanwhile, made of the segments closed at once (if the minimum
+        length is matched), the resulting B-step (if any) and the B-steps completed meanwhile.
+        """
+        sensor_id = entry[self.sensor_id_pos]
+        timestamp = None
+        if self.max_idle:
+            timestamp = datetime.fromisoformat(entry[self.date_pos] + ' ' + entry[self.time_pos])
+        return list(self._segment_measure(offset, self._intern_sensor(sensor_id), sensor_id, entry, timestamp))
+
+    def close_segments(self):
+        """
+        Close all the open segments, e.g. when the live source of the entries is over (see add_entry()).
+
+        :return: the result of closing the segments, as the ones returned by add_entry() (then all the B-steps are
+        complete).
+        """
+        return self._close_remaining_segments()
+
     """ UTILITY FUNCTIONS """
 
-    def _find_segments(self, sensor_log):
+    def _find_segments(self):
+        """
+        Find segments in the sensor log, storing all of them together with the B-steps (in order of execution).
+        """
+        for result in self._iter_segmentation():
+            self._add_result(result)
+
+    def _add_result(self, result):
+        """
+        Store the segments closed at once and the resulting B-step (if any).
+
+        :param result: the result of closing segments (see _close_segments()), None if no segment has been closed.
+        """
+        if result:
+            self.segments.extend(result[0])
+            if result[1]:
+                self.b_steps.append(result[1])
+
+    def _stitch_partition(self, sensor_log, start, end, sensors, b_steps, open_segments, last_b_step,
+                          compat_b_steps, max_open_segments_num):
         """
-        Find segments in the given sensor log.
+        Segment the given partition of the sensor log, resuming from the current state, until it matches the state
+        of the separate segmentation of the partition (see _segment_partition() and _match_states()). From then on,
+        the segments and the B-steps of the separate segmentation are taken, replacing its objects with the equivalent
+        ones already existing (i.e. open segments, extended with the measures segmented later, and incomplete B-steps).
 
         :type sensor_log: file
-        :param sensor_log: the tab-separated file containing the sensor log.
+        :type start: int
+        :type end: int
+        :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode).
+        :param start: the byte offset of the first entry of the partition.
+        :param end: the byte offset following the last entry of the partition.
+        :param sensors: the sensor ids known by the separate segmentation, by code.
+        :param b_steps: the B-steps of the separate segmentation, together with the number of measures segmented
+        when each of them has been performed.
+        :param open_segments: the open segments at the end of the separate segmentation.
+        :param last_b_step: the last B-step of the separate segmentation.
+        :param compat_b_steps: the incomplete B-steps of the separate segmentation, by compatible segment.
+        :param max_open_segments_num: the maximum number of segments open at once in the separate segmentation (the
+        maximum of the whole segmentation is approximated by the ones of the partitions).
         """
-        sensor_log_reader = csv.reader(sensor_log, delimiter=LOG_ENTRY_DELIMITER)
+        # segment the partition from scratch as well, to find when the states match
+        replica = SegmentedSensorLog(sensor_log=sensor_log, top_compat_matrix=self.top_compat_matrix,
+                                     compat_threshold=self.compat_threshold, sensor_id_pos=self.sensor_id_pos,
+                                     noise_threshold=self.noise_threshold, lazy=True)
+        measures_num = 0
+        entries = _iter_range_entries(sensor_log, start, end)
+        matches = _match_states(self, replica, start)
+        while not matches:
+            offset, entry = next(entries, (None, None))
+            if entry is None:
+                return  # the states never match, the partition has been entirely segmented from the current state
+            measures_num += 1
+            sensor_id = entry[self.sensor_id_pos]
+            self._add_result(self._add_measure(offset, self._intern_sensor(sensor_id), sensor_id))
+            replica._add_measure(offset, replica._intern_sensor(sensor_id), sensor_id)
+            matches = _match_states(self, replica, start)
+        segments_nums, own_b_steps = matches
 
-        open_segments = []
-        for measure in sensor_log_reader:
-            sensor_id = measure[self.sensor_id_pos]
+        # recode the new sensors of the separate segmentation, if any
+        codes_map = None
+        if sensors != self.sensors[:len(sensors)]:
+            codes_map = [self._intern_sensor(sensor_id) for sensor_id in sensors]
 
-            # find compatible open segments
-            compat_segments_idxs = self._get_compat_segments_indices(open_segments, sensor_id)
+        own_segments = {num: segment for group in self._open_segments.values() for num, segment in group.items()}
+        translated = {}
 
-            # check compatibility results
-            if len(compat_segments_idxs) == 1:
-                # only one compat segment exists, append the measure
-                segment_idx = compat_segments_idxs[0]
-                open_segments[segment_idx].append(measure)
+        def translate_segment(segment):
+            # open segments are updated with the measures appended after the states matched
+            if id(segment) in translated:
+                return translated[id(segment)]
+            if codes_map:
+                segment.codes = array('I', [codes_map[code] for code in segment.codes])
+            own_segment = own_segments.get(segments_nums.get(segment.offsets[0]))
+            if own_segment is not None:
+                # keep the measures preceding the partition
+                prefix_length = bisect_left(own_segment.offsets, start)
+                own_segment.offsets = own_segment.offsets[:prefix_length] + segment.offsets
+                own_segment.codes = own_segment.codes[:prefix_length] + segment.codes
+            else:
+                own_segment = segment
+            translated[id(segment)] = own_segment
+            return own_segment
 
+        def translate_b_step(b_step):
+            # incomplete B-steps are updated with the compatible segments opened after the states matched
+            if b_step is None:
+                return None
+            if id(b_step) in translated:
+                return translated[id(b_step)]
+            own_b_step = own_b_steps.get(_get_b_step_key(b_step))
+            if own_b_step is not None:
+                compat_segments = [translate_segment(s) for s in b_step.compat_segments]
+                own_b_step.compat_segments.extend(compat_segments[len(own_b_step.compat_segments):])
+                own_b_step.open_compat_num = b_step.open_compat_num
             else:
-                if len(compat_segments_idxs) > 1:
-                    # if many compat segments exist, close them (B-step)
-                    self._close_segments(open_segments, compat_segments_idxs)
+                # the segments closed at once are sorted from the most recently opened one
+                b_step.closed_segments = sorted([translate_segment(s) for s in b_step.closed_segments],
+                                                key=lambda s: s.offsets[0], reverse=True)
+                b_step.compat_segments = [translate_segment(s) for s in b_step.compat_segments]
+                own_b_step = b_step
+            translated[id(b_step)] = own_b_step
+            return own_b_step
 
-                # open new segment and append the measure
-                new_segment = [measure]
-                open_segments.append(new_segment)
+        for b_step_measures_num, b_step in b_steps:
+            if b_step_measures_num > measures_num:
+                own_b_step = translate_b_step(b_step)
+                self.segments.extend(own_b_step.closed_segments)
+                self.b_steps.append(own_b_step)
+            elif _get_b_step_key(b_step) in own_b_steps:
+                translate_b_step(b_step)
 
-                # check whether the new segment is compatible with at least a segment in last B-step
-                if self.b_steps:
-                    if self._get_compat_segments_indices(self.b_steps[-1].closed_segments, sensor_id):
-                        # add new segment to last B-step compatibility list
-                        self.b_steps[-1].add_compat_segment(new_segment)
+        self._open_segments = {
+            sensor_id: {segments_nums.get(num, num): translate_segment(segment) for num, segment in group.items()}
+            for sensor_id, group in open_segments.items()
+        }
+        self._last_b_step = translate_b_step(last_b_step)
+        self._open_segments_num = sum(len(group) for group in self._open_segments.values())
+        self.max_open_segments_num = max(self.max_open_segments_num, max_open_segments_num)
+        self._compat_b_steps = {segments_nums.get(num, num): translate_b_step(b_step)
+                                for num, b_step in compat_b_steps.items()}
 
-        # close remaining open segments
-        self._close_segments(open_segments)
+    def _iter_segmentation(self):
+        """
+        Find segments in the sensor log, one measure at a time.
 
-    def _get_compat_segments_indices(self, segments, sensor_id):
+        :return: a generator of tuples made of the segments closed at once (if the minimum length is matched), the
+        resulting B-step (if any) and the B-steps completed meanwhile.
         """
-        Return tho positions of the segments that are compatible (according to the given threshold) with the provided
-        sensor identifier.
+        start_time = time.perf_counter()
+        for offset, code, sensor_id, measure, timestamp in self._iter_measures():
+            yield from self._segment_measure(offset, code, sensor_id, measure, timestamp)
+
+        yield self._close_remaining_segments()
+        if self.stats is not None:
+            self.stats.seconds += time.perf_counter() - start_time
+
+    def _segment_measure(self, offset, code, sensor_id, measure, timestamp):
+        """
+        Segment the given measure, updating the topological compatibility matrix and closing the idle segments first
+        (if required).
+
+        :return: a generator of the results of closing segments (see _iter_segmentation()).
+        """
+        if self.update_matrix:
+            self.top_compat_matrix.add_entry(measure)
+            self._compat_index = self.top_compat_matrix.get_compat_index(self.compat_threshold)
+
+        if self.max_idle:
+            result = self._close_idle_segments(timestamp)
+            if result:
+                yield result
+
+        result = self._add_measure(offset, code, sensor_id, timestamp)
+        if result:
+            yield result
+
+    def _add_measure(self, offset, code, sensor_id, timestamp=None):
+        """
+        Segment the given measure, i.e. append it to the only compatible open segment or open a new segment for it
+        (closing the compatible ones, if any).
+
+        :type offset: int
+        :type code: int
+        :type timestamp: datetime
+        :param offset: the byte offset of the measure in the sensor log (it identifies the segment opened by it).
+        :param code: the code of the sensor of the measure.
+        :param sensor_id: the id of the sensor of the measure.
+        :param timestamp: the timestamp of the measure (needed only if max_idle is set).
+        :return: the result of closing the compatible segments (see _close_segments()), None if no segment is closed.
+        """
+        open_segments = self._open_segments
+
+        # find the groups of compatible open segments (the intersection iterates over the smallest collection)
+        compat_predecessors = self._get_compat_predecessors(sensor_id)
+        compat_groups = open_segments.keys() & compat_predecessors
+        stats = self.stats
+        if stats is not None:
+            compat_checks_num = min(len(open_segments), len(compat_predecessors))
+
+        # check compatibility results
+        if len(compat_groups) == 1 and len(open_segments[next(iter(compat_groups))]) == 1:
+            # only one compat segment exists, append the measure (and move the segment to the new group)
+            segment_num, segment = open_segments.pop(compat_groups.pop()).popitem()
+            segment.append(offset, code)
+            open_segments.setdefault(sensor_id, {})[segment_num] = segment
+            if timestamp:
+                self._last_measures[segment_num] = (sensor_id, timestamp)
+                self._last_measures.move_to_end(segment_num)
+            if stats is not None:
+                stats.add_measure(compat_checks_num, self._open_segments_num)
+            return None
+
+        result = None
+        if compat_groups:
+            # if many compat segments exist, close them (B-step)
+            result = self._close_segments(compat_groups)
+
+        # open new segment and append the measure
+        new_segment = Segment()
+        new_segment.append(offset, code)
+        open_segments.setdefault(sensor_id, {})[offset] = new_segment
+        self._open_segments_num += 1
+        if self._open_segments_num > self.max_open_segments_num:
+            self.max_open_segments_num = self._open_segments_num
+        if timestamp:
+            self._last_measures[offset] = (sensor_id, timestamp)
+
+        # check whether the new segment is compatible with at least a segment in last B-step
+        if self._last_b_step:
+            if not compat_predecessors.isdisjoint(self._last_b_step.closed_sensors):
+                # add new segment to last B-step compatibility list
+                self._last_b_step.add_compat_segment(new_segment)
+                self._last_b_step.open_compat_num += 1
+                self._compat_b_steps[offset] = self._last_b_step
+
+        if stats is not None:
+            stats.add_measure(compat_checks_num, self._open_segments_num)
+        return result
+
+    def _close_idle_segments(self, timestamp):
+        """
+        Close the open segments whose last measure precedes the given timestamp by more than the maximum idle time.
+        The closed segments do not form a B-step.
+
+        :type timestamp: datetime
+        :param timestamp: the timestamp of the current measure.
+        :return: a tuple made of the closed segments that match the minimum length, None (i.e. no B-step) and the
+        B-steps completed by closing their last compatible segments; None if no segment is closed.
+        """
+        last_measures = self._last_measures
+        if not last_measures:
+            return None
+        min_timestamp = timestamp - self.max_idle
+        closed_segments = []
+        completed_b_steps = []
+        idle_segments_num = 0
+        while last_measures:
+            segment_num, (sensor_id, last_timestamp) = next(iter(last_measures.items()))
+            if last_timestamp >= min_timestamp:
+                break
+            del last_measures[segment_num]
+            group = self._open_segments[sensor_id]
+            segment = group.pop(segment_num)
+            if not group:
+                del self._open_segments[sensor_id]
+            self._open_segments_num -= 1
+            idle_segments_num += 1
+
+            self._release_compat_b_step(segment_num, completed_b_steps)
+            if len(segment) >= self.noise_threshold:  # noise filtering
+                closed_segments.append(segment)
+
+        if self.stats is not None:
+            self.stats.closed_segments_num += idle_segments_num
+            self.stats.idle_segments_num += idle_segments_num
+            self.stats.noise_segments_num += idle_segments_num - len(closed_segments)
+
+        if not closed_segments and not completed_b_steps:
+            return None
+        return closed_segments, None, completed_b_steps
+
+    def _close_remaining_segments(self):
+        """
+        Close all the open segments at the end of the sensor log (then the last B-step is complete as well).
+
+        :return: the result of closing the segments (see _close_segments()), including the last B-step among the
+        completed ones.
+        """
+        closed_segments, b_step, completed_b_steps = self._close_segments()
+        if self._last_b_step:
+            completed_b_steps.append(self._last_b_step)
+            self._last_b_step = None
+        return closed_segments, b_step, completed_b_steps
+
+    def _iter_measures(self):
+        """
+        Iterate over the measures to be segmented, either reading them from the sensor log or from the parsed events.
+
+        :return: a generator of tuples made of the byte offset, the sensor code, the sensor id, the log entry (None
+        when segmenting parsed events) and the timestamp (None if max_idle is not set) of each measure.
+        """
+        sensors = self.sensors
+        timestamp = None
+        if self._events is not None:
+            for offset, code, timestamp in self._events.iter_events():
+                if self.max_idle:
+                    timestamp = ColumnarSensorLog.to_datetime(timestamp)
+                yield offset, code, sensors[code], None, timestamp
+            return
+
+        sensor_codes = self._sensor_codes
+        for offset, measure in iter_entries_with_offsets(self._sensor_log):
+            sensor_id = measure[self.sensor_id_pos]
+            try:
+                code = sensor_codes[sensor_id]
+            except KeyError:
+                code = sensor_codes[sensor_id] = len(sensors)
+                sensors.append(sensor_id)
+            if self.max_idle:
+                timestamp = datetime.fromisoformat(measure[self.date_pos] + ' ' + measure[self.time_pos])
+            yield offset, code, sensor_id, measure, timestamp
+
+    def _use_matrix_codes(self):
+        """
+        Assign the same codes of the topological compatibility matrix to the sensors (before segmenting any measure),
+        so that separate segmentations agree on the codes of the sensors known by the matrix.
+        """
+        self.sensors = list(self.top_compat_matrix.sensors)
+        self._sensor_codes = dict(self.top_compat_matrix.sensor_codes)
+
+    def _intern_sensor(self, sensor_id):
+        """
+        Return the code associated with the given sensor, assigning the next available one if the sensor is unknown.
 
-        :type segments: list
-        :param segments: the list of open segments.
         :param sensor_id: the sensor identifier.
-        :return: a list containing the indices of the compatible segments.
+        :return: the sensor code.
         """
-        compat_segments_idxs = []
-        for idx, os in enumerate(segments):
-            # consider the sensor id of the last measure in segment
-            old_sensor_id = os[-1][self.sensor_id_pos]
+        try:
+            return self._sensor_codes[sensor_id]
+        except KeyError:
+            code = self._sensor_codes[sensor_id] = len(self.sensors)
+            self.sensors.append(sensor_id)
+            return code
 
-            if self.top_compat_matrix.prob_matrix[old_sensor_id][sensor_id] >= self.compat_threshold:
-                # the direct succession value is above the threshold -> segment is compatible
-                compat_segments_idxs.append(idx)
-        return compat_segments_idxs
+    def _get_compat_predecessors(self, sensor_id):
+        """
+        Return the sensor identifiers that are compatible (according to the given threshold) with the provided sensor
+        identifier, when they immediately precede it.
 
-    def _close_segments(self, open_segments, indices=None):
+        :param sensor_id: the sensor identifier.
+        :return: the set of compatible predecessors.
         """
-        Remove the segments identified by the given indices from the open list and add them to close list (if the
-        minimum length is matched). If the indices are not provided, then all segments will be closed.
+        return self._compat_index.get(sensor_id, frozenset())
 
-        :type open_segments: list
-        :type indices: list
-        :param open_segments: the list of open segments.
-        :param indices: the positions of the segments to be closed.
+    def _close_segments(self, groups=None):
         """
-        if indices:
-            indices = sorted(indices)
-        else:
-            # build a list of all possible indices to use the same approach for both cases.
-            indices = [x for x in range(len(open_segments))]
+        Remove the segments in the given groups from the open segments and group them in a B-step (if the minimum
+        length is matched). If the groups are not provided, then all segments will be closed.
+        Segments are closed from the most recently opened one.
+
+        :type groups: set
+        :param groups: the last sensor ids of the groups of segments to be closed.
+        :return: a tuple made of the closed segments that match the minimum length, the resulting B-step (None if no
+        segment matches the minimum length) and the B-steps completed by closing their last compatible segments.
+        """
+        if groups is None:
+            # consider all groups to use the same approach for both cases.
+            groups = list(self._open_segments)
+
+        closed_segments = []
+        for sensor_id in groups:
+            closed_segments.extend((segment_num, segment, sensor_id)
+                                   for segment_num, segment in self._open_segments.pop(sensor_id).items())
+        closed_segments.sort(key=itemgetter(0), reverse=True)
+        self._open_segments_num -= len(closed_segments)
 
-        # add all segments to be closed to the global segments list and group them in a B-step
         b_step = BStep()
-        for idx in reversed(indices):
-            closed_segment = open_segments.pop(idx)          # remove segment from open list
+        completed_b_steps = []
+        for segment_num, closed_segment, sensor_id in closed_segments:
+            self._release_compat_b_step(segment_num, completed_b_steps)
+            if self.max_idle:
+                self._last_measures.pop(segment_num, None)
+
             if len(closed_segment) >= self.noise_threshold:  # noise filtering
-                self.segments.append(closed_segment)
-                b_step.add_closed_segment(closed_segment)
-        if b_step.closed_segments:
-            self.b_steps.append(b_step)
+                b_step.add_closed_segment(closed_segment, sensor_id)
+
+        if self.stats is not None:
+            self.stats.closed_segments_num += len(closed_segments)
+            self.stats.noise_segments_num += len(closed_segments) - len(b_step.closed_segments)
+            self.stats.b_steps_num += bool(b_step.closed_segments)
+
+        if not b_step.closed_segments:
+            return [], None, completed_b_steps
+
+        # the new B-step follows the last one, which is complete if all its compatible segments are closed
+        if self._last_b_step and not self._last_b_step.open_compat_num:
+            completed_b_steps.append(self._last_b_step)
+        self._last_b_step = b_step
+        return b_step.closed_segments, b_step, completed_b_steps
+
+    def _release_compat_b_step(self, segment_num, completed_b_steps):
+        """
+        Update the B-step the given closed segment is compatible with (if any), which is complete if all its compatible
+        segments are closed and it is not the last one.
+
+        :type segment_num: int
+        :type completed_b_steps: list
+        :param segment_num: the opening number of the closed segment.
+        :param completed_b_steps: the list where the completed B-step is appended.
+        """
+        compat_b_step = self._compat_b_steps.pop(segment_num, None)
+        if compat_b_step:
+            compat_b_step.open_compat_num -= 1
+            if not compat_b_step.open_compat_num and compat_b_step is not self._last_b_step:
+                completed_b_steps.append(compat_b_step)
 
     """ DEPRECATED FUNCTIONS """
 
@@ -202,3 +858,264 @@ class SegmentedSensorLog(object):
             # prepare next step (slide the window by one position)
             s0 = s1
             s1 = next(sensor_log_reader, None)
+
+
+def sweep_thresholds(sensor_log, top_compat_matrix, thresholds, sensor_id_pos=SENSOR_ID_POS, processes=1):
+    """
+    Segment the given sensor log once for each pair of thresholds, parsing the log only once (or never, if it is
+    columnar). The segmentations share the parsed events and the topological compatibility matrix (whose
+    compatibility indices are computed once per compatibility threshold), and they can be performed in a pool of
+    processes.
+
+    :type sensor_log: file | ColumnarSensorLog
+    :type top_compat_matrix: TopologicalCompatMatrix
+    :type thresholds: list
+    :type processes: int
+    :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode), or its columnar
+    version.
+    :param top_compat_matrix: the topological compatibility matrix of the sensor log.
+    :param thresholds: a list of tuples made of a compatibility threshold and a noise threshold.
+    :param sensor_id_pos: the position of the sensor id in the log entry.
+    :param processes: the number of processes (if None, the number of CPUs).
+    :return: a list of dicts (one for each pair of thresholds, in the same order) containing the segments number,
+    the segments length distribution and the B-steps number.
+    """
+    if isinstance(sensor_log, ColumnarSensorLog):
+        events = sensor_log  # the columns are mapped again by the worker processes, instead of being copied
+    else:
+        events = SensorLogEvents(sensor_log, sensor_id_pos=sensor_id_pos)
+    for compat_threshold in set(compat for compat, _ in thresholds):
+        top_compat_matrix.get_compat_index(compat_threshold)  # compute the indices before sharing the matrix
+
+    if processes == 1:
+        return [_sweep_point(events, top_compat_matrix, compat, noise) for compat, noise in thresholds]
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(top_compat_matrix, events)) as pool:
+        return pool.starmap(_sweep_point, [(None, None, compat, noise) for compat, noise in thresholds])
+
+
+_worker_top_compat_matrix = None
+_worker_events = None
+
+
+def _init_worker(top_compat_matrix, events=None):
+    """
+    Store the topological compatibility matrix and the events shared by all the segmentations of a worker process.
+    """
+    global _worker_top_compat_matrix, _worker_events
+    _worker_top_compat_matrix = top_compat_matrix
+    _worker_events = events
+
+
+def _sweep_point(events, top_compat_matrix, compat_threshold, noise_threshold):
+    """
+    Segment the given events according to the given thresholds, without storing segments and B-steps.
+
+    :type events: SensorLogEvents | ColumnarSensorLog
+    :type top_compat_matrix: TopologicalCompatMatrix
+    :param events: the parsed events of the sensor log (if None, the ones shared by the worker process).
+    :param top_compat_matrix: the topological compatibility matrix (if None, the one shared by the worker process).
+    :param compat_threshold: the threshold to reach for a direct succession to be significant.
+    :param noise_threshold: the minimum length of a segment.
+    :return: a dict containing the segmentation statistics.
+    """
+    events = events if events is not None else _worker_events
+    top_compat_matrix = top_compat_matrix or _worker_top_compat_matrix
+    ssl = SegmentedSensorLog(events=events, top_compat_matrix=top_compat_matrix, compat_threshold=compat_threshold,
+                             noise_threshold=noise_threshold, lazy=True)
+    lengths = Counter()
+    b_steps_num = 0
+    for closed_segments, b_step, _ in ssl._iter_segmentation():
+        lengths.update(len(s) for s in closed_segments)
+        if b_step:
+            b_steps_num += 1
+
+    segments_num = sum(lengths.values())
+    return {
+        'compat_threshold': compat_threshold,
+        'noise_threshold': noise_threshold,
+        'segments_num': segments_num,
+        'min_length': min(lengths) if lengths else 0,
+        'max_length': max(lengths) if lengths else 0,
+        'avg_length': sum(l * n for l, n in lengths.items()) / segments_num if segments_num else 0,
+        'median_length': median(lengths.elements()) if lengths else 0,
+        'lengths': dict(sorted(lengths.items())),
+        'b_steps_num': b_steps_num,
+    }
+
+
+def _segment_partition(path, start, end, compat_threshold, sensor_id_pos, noise_threshold):
+    """
+    Segment the given partition of the sensor log from scratch, against the topological compatibility matrix shared
+    by the worker process, leaving the segments still open at the end of the partition as they are.
+
+    :type path: str
+    :type start: int
+    :type end: int
+    :param path: the path of the tab-separated file containing the sensor log.
+    :param start: the byte offset of the first entry of the partition.
+    :param end: the byte offset following the last entry of the partition.
+    :param compat_threshold: the threshold to reach for a direct succession to be significant.
+    :param sensor_id_pos: the position of the sensor id in the log entry.
+    :param noise_threshold: the minimum length of a segment.
+    :return: a tuple made of the sensor ids by code, the B-steps together with the number of measures segmented when
+    each of them has been performed, the open segments, the last B-step, the incomplete B-steps by compatible
+    segment and the maximum number of segments open at once.
+    """
+    with open(path, 'rb') as sensor_log:
+        ssl = SegmentedSensorLog(sensor_log=sensor_log, top_compat_matrix=_worker_top_compat_matrix,
+                                 compat_threshold=compat_threshold, sensor_id_pos=sensor_id_pos,
+                                 noise_threshold=noise_threshold, lazy=True)
+        ssl._use_matrix_codes()
+        b_steps = []
+        for measures_num, (offset, entry) in enumerate(_iter_range_entries(sensor_log, start, end), 1):
+            sensor_id = entry[sensor_id_pos]
+            result = ssl._add_measure(offset, ssl._intern_sensor(sensor_id), sensor_id)
+            if result and result[1]:
+                b_steps.append((measures_num, result[1]))
+    return ssl.sensors, b_steps, ssl._open_segments, ssl._last_b_step, ssl._compat_b_steps, ssl.max_open_segments_num
+
+
+def _match_states(ssl, other, start):
+    """
+    Check whether the given segmentations are in the same state, i.e. they will make the same choices from now on,
+    assuming that the other segmentation has started from scratch at the given offset. This is the case when their
+    open segments can be paired by last measure, s.t. they have the same measures since the given offset and the
+    same outcome of noise filtering, and when their incomplete B-steps can be paired as well. Notice that paired
+    segments may be opened in a different order, which affects only the order of the segments closed at once.
+
+    :type ssl: SegmentedSensorLog
+    :type other: SegmentedSensorLog
+    :type start: int
+    :param ssl: a segmentation.
+    :param other: the other segmentation.
+    :param start: the byte offset where the other segmentation has started from.
+    :return: None if the states do not match, otherwise a tuple made of the opening numbers of the open segments and
+    the incomplete B-steps of the segmentation, by the corresponding ones of the other segmentation.
+    """
+    if len(ssl._open_segments) != len(other._open_segments) or \
+            len(ssl._compat_b_steps) != len(other._compat_b_steps) or \
+            ssl._open_segments.keys() != other._open_segments.keys():
+        return None
+
+    # pair the open segments by last measure
+    segments_nums = {}
+    for sensor_id, other_group in other._open_segments.items():
+        group = ssl._open_segments[sensor_id]
+        if len(group) != len(other_group):
+            return None
+        last_offsets = {segment.offsets[-1]: num for num, segment in group.items()}
+        for other_num, other_segment in other_group.items():
+            num = last_offsets.get(other_segment.offsets[-1])
+            if num is None:
+                return None
+            segment = group[num]
+            prefix_length = len(segment) - len(other_segment)
+            if prefix_length < 0 or \
+                    (prefix_length and len(other_segment) < ssl.noise_threshold) or \
+                    (prefix_length and segment.offsets[prefix_length - 1] >= start) or \
+                    segment.offsets[prefix_length:] != other_segment.offsets:
+                return None
+            segments_nums[other_num] = num
+
+    # pair the incomplete B-steps through the last one and the compatible open segments
+    b_steps = {}
+    paired = set()
+    pairs = [(ssl._last_b_step, other._last_b_step)]
+    pairs.extend((ssl._compat_b_steps.get(num), other._compat_b_steps.get(other_num))
+                 for other_num, num in segments_nums.items())
+    for b_step, other_b_step in pairs:
+        if b_step is None or other_b_step is None:
+            if b_step is not other_b_step:
+                return None
+            continue
+        key = _get_b_step_key(other_b_step)
+        if key in b_steps:
+            if b_steps[key] is not b_step:
+                return None
+        elif id(b_step) in paired or not _same_b_step(b_step, other_b_step):
+            return None
+        b_steps[key] = b_step
+        paired.add(id(b_step))
+    return segments_nums, b_steps
+
+
+def _same_b_step(b_step, other):
+    """
+    Check whether the given B-steps are the same, as far as the segmentation still to be performed is concerned.
+
+    :type b_step: BStep
+    :type other: BStep
+    :param b_step: a B-step.
+    :param other: the other B-step.
+    :return: True if the B-steps are the same, False otherwise.
+    """
+    return b_step.closed_sensors == other.closed_sensors and \
+        b_step.open_compat_num == other.open_compat_num and \
+        len(b_step.compat_segments) == len(other.compat_segments)
+
+
+def _get_b_step_key(b_step):
+    """
+    Return the identifier of the given B-step, i.e. the byte offset of the first measure of its first closed segment.
+
+    :type b_step: BStep
+    :param b_step: the B-step.
+    :return: the B-step identifier.
+    """
+    return b_step.closed_segments[0].offsets[0]
+
+
+def _find_partition_start(sensor_log, offset, max_gap=None, date_pos=DATE_POS, time_pos=TIME_POS):
+    """
+    Find the first log entry that starts a new partition after the given byte offset, i.e. the first entry with a
+    different date from the previous one (or following it by a time gap longer than the given one).
+
+    :type sensor_log: file
+    :type offset: int
+    :type max_gap: datetime.timedelta
+    :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode).
+    :param offset: the byte offset where the search starts from.
+    :param max_gap: the minimum time gap between two partitions (if None, partitions are split by date).
+    :param date_pos: the position of the date in the log entry.
+    :param time_pos: the position of the time in the log entry (used only if max_gap is set).
+    :return: the byte offset of the entry starting the partition (the file size if no entry is found).
+    """
+    if offset == 0:
+        return 0
+    sensor_log.seek(offset - 1)
+    sensor_log.readline()  # move to the beginning of the next line
+
+    previous = None
+    while True:
+        line_offset = sensor_log.tell()
+        line = sensor_log.readline()
+        if not line:
+            return line_offset
+        entry = next(csv.reader([line], delimiter=LOG_ENTRY_DELIMITER))
+        if max_gap:
+            entry = datetime.fromisoformat(entry[date_pos] + ' ' + entry[time_pos])
+            if previous is not None and entry - previous > max_gap:
+                return line_offset
+        elif previous is not None and entry[date_pos] != previous[date_pos]:
+            return line_offset
+        previous = entry
+
+
+def _iter_range_entries(sensor_log, start, end):
+    """
+    Iterate over the entries of the given sensor log within the given byte range, together with their byte offsets.
+
+    :type sensor_log: file
+    :type start: int
+    :type end: int
+    :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode).
+    :param start: the byte offset of the first entry.
+    :param end: the byte offset following the last entry.
+    :return: a generator of tuples made of the byte offset and the log entry.
+    """
+    sensor_log.seek(start)
+    for offset, entry in iter_entries_with_offsets(sensor_log):
+        if offset >= end:
+            break
+        yield offset, entry
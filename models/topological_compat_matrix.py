@@ -1,52 +1,334 @@
+import hashlib
+import multiprocessing
+import os
+from itertools import chain
+from types import MappingProxyType
+
 import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import PatchCollection
+from matplotlib.patches import Rectangle
 import pandas as pd
 import seaborn as sn
 import unicodecsv as csv
 
-from utils.constants import LOG_ENTRY_DELIMITER, SENSOR_ID_POS
+from models.columnar_sensor_log import ColumnarSensorLog
+from utils.constants import LOG_ENTRY_DELIMITER, SENSOR_ID_POS, TCM_CACHE_FOLDER, NPZ_EXT, FILENAME_SEPARATOR
 
 
 class TopologicalCompatMatrix(object):
     THRESHOLD_ERROR = 'The threshold must be a value between 0 and 1 (included).'
     Y_LABELS_ROT = 0
     X_LABELS_ROT = 90
+    MIN_CAPACITY = 16
 
-    def __init__(self, sensor_log, sensor_id_pos=SENSOR_ID_POS):
+    def __init__(self, sensor_log=None, sensor_id_pos=SENSOR_ID_POS):
         """
         Topological compatibility matrix associated with the given sensor log. An entry of this matrix states the
         probability that the sensor on the row is followed by the sensor on the column in the log.
-        
-        :type sensor_log: file
-        :param sensor_log: the tab-separated file containing the sensor log.
+        Sensor ids are interned to dense integer codes (in order of first appearance). Only the non-zero cells are
+        stored, since most of the successions never happen: a missing cell means probability 0. The raw succession
+        counters are kept, so that the matrix can be updated as new log entries become available (see update() and
+        update_from_file()).
+
+        :type sensor_log: file | ColumnarSensorLog
+        :param sensor_log: the tab-separated file containing the sensor log, or its columnar version (if None, an empty
+        matrix is built).
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        """
+        self.sensor_id_pos = sensor_id_pos
+        self.sensors = []       # the known sensor ids, the position of each id is its code.
+        self.sensor_codes = {}  # the code associated with each known sensor id.
+
+        self._counts = []                                # the non-zero succession counters of each row, by code.
+        self._occurrences = np.zeros(0, dtype=np.int64)  # the sensors occurrences (allocated with spare capacity).
+        self._last_code = None                           # the code of the last sensor seen so far.
+
+        self._dirty_rows = set()  # the codes of the rows whose values must be normalized again.
+        self._prob_rows = {}      # the rows of the probabilistic matrix, backing the read-only view.
+        self._prob_matrix_view = MappingProxyType({})
+        self._compat_indices = {}  # the compatible predecessors of each sensor, by threshold.
+
+        if isinstance(sensor_log, ColumnarSensorLog):
+            self.update_from_columnar(sensor_log)
+        elif sensor_log is not None:
+            self.update(csv.reader(sensor_log, delimiter=LOG_ENTRY_DELIMITER))
+
+    def __getstate__(self):
+        # the read-only view cannot be pickled, it is rebuilt from the rows when unpickling
+        state = self.__dict__.copy()
+        del state['_prob_matrix_view']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._prob_matrix_view = MappingProxyType({
+            sensor: MappingProxyType(row) for sensor, row in self._prob_rows.items()
+        })
+
+    @property
+    def prob_matrix(self):
+        """
+        A read-only view of the probabilistic matrix, to be accessed as prob_matrix[predecessor][successor], where
+        the rows contain only the non-zero cells (missing ones are worth 0). The rows affected by the updates
+        performed since the last access are normalized again.
+
+        :rtype: MappingProxyType
+        """
+        self._normalize()
+        return self._prob_matrix_view
+
+    @property
+    def sensors_occurrences(self):
+        """
+        The number of occurrences of each sensor in the log.
+
+        :rtype: dict
+        """
+        return {sensor: int(occ) for sensor, occ in zip(self.sensors, self._occurrences.tolist())}
+
+    def update(self, entries):
+        """
+        Update the succession counters with the given log entries, assuming that they immediately follow the ones
+        already considered. The probabilistic matrix is normalized again only when accessed.
+
+        :param entries: an iterable of log entries (e.g. the rows of a csv reader).
+        """
+        codes = np.fromiter((self._intern_sensor(entry[self.sensor_id_pos]) for entry in entries), dtype=np.int64)
+        self._add_codes(codes)
+
+    def add_entry(self, entry):
+        """
+        Update the succession counters with the given log entry, assuming that it immediately follows the ones already
+        considered. The cost is constant (e.g. to follow a live source one entry at a time).
+
+        :type entry: list
+        :param entry: the log entry.
+        """
+        code = self._intern_sensor(entry[self.sensor_id_pos])
+        self._reserve(len(self.sensors))
+        self._occurrences[code] += 1
+        self._dirty_rows.add(code)
+        if self._last_code is not None:
+            self._add_successions([self._last_code], [code], [1])
+            self._dirty_rows.add(self._last_code)
+        self._last_code = code
+
+    def update_from_columnar(self, columnar_log):
+        """
+        Update the succession counters with the events of the given columnar sensor log, assuming that they
+        immediately follow the ones already considered. The sensor codes of the log are translated at once, without
+        parsing any text.
+
+        :type columnar_log: ColumnarSensorLog
+        :param columnar_log: the columnar sensor log.
+        """
+        # the sensors of the log are sorted by first appearance, so they are interned in the same order of update()
+        codes_map = np.fromiter((self._intern_sensor(sensor) for sensor in columnar_log.sensors), dtype=np.int64,
+                                count=len(columnar_log.sensors))
+        self._add_codes(codes_map[columnar_log.codes])
+
+    def update_from_file(self, path, offset=0):
+        """
+        Update the succession counters with the log entries stored in the given file, starting from the given byte
+        offset. A trailing incomplete line (e.g. still being written) is left for the next update.
+
+        :type path: str
+        :type offset: int
+        :param path: the path of the tab-separated file containing the sensor log.
+        :param offset: the byte offset of the first entry to be considered.
+        :return: the byte offset where the next update has to start from.
+        """
+        lines = []
+        with open(path, 'rb') as sensor_log:
+            sensor_log.seek(offset)
+            for line in sensor_log:
+                if not line.endswith(b'\n'):
+                    break
+                lines.append(line)
+                offset += len(line)
+        self.update(csv.reader(lines, delimiter=LOG_ENTRY_DELIMITER))
+        return offset
+
+    def get_compat_index(self, threshold):
+        """
+        Return the index of the compatible predecessors of each sensor, i.e. the predecessors whose direct succession
+        probability with the sensor is greater or equal to the given threshold. The index is computed once per
+        threshold and kept up to date with the rows affected by later updates.
+        The returned index is shared, it must not be modified.
+
+        :type threshold: float
+        :param threshold: a value between 0 and 1.
+        :return: a dict mapping each sensor id to the set of its compatible predecessors ids.
+        """
+        if threshold < 0 or threshold > 1:
+            raise ValueError(self.THRESHOLD_ERROR)
+        self._normalize()
+        try:
+            return self._compat_indices[threshold]
+        except KeyError:
+            pass
+
+        if threshold == 0:
+            # any succession is compatible, even if it never happens
+            index = {sensor: set(self.sensors) for sensor in self.sensors}
+        else:
+            index = {sensor: set() for sensor in self.sensors}
+            for row_id, row in self._prob_rows.items():
+                for col_id, value in row.items():
+                    if value >= threshold:
+                        index[col_id].add(row_id)
+        self._compat_indices[threshold] = index
+        return index
+
+    @classmethod
+    def from_file_parallel(cls, path, sensor_id_pos=SENSOR_ID_POS, processes=None):
+        """
+        Build the topological compatibility matrix associated with the given sensor log using a pool of processes.
+        The log is split by byte range into as many shards as processes, each shard is counted separately and the
+        partial counters are merged in order, counting exactly once the successions at shards boundaries.
+        The result is identical to the one of the sequential construction.
+
+        :type path: str
+        :type processes: int
+        :param path: the path of the tab-separated file containing the sensor log.
         :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param processes: the number of processes (if None, the number of CPUs).
+        :return: the topological compatibility matrix.
+        """
+        processes = processes or os.cpu_count()
+        size = os.path.getsize(path)
+        bounds = [size * i // processes for i in range(processes + 1)]
+
+        with multiprocessing.Pool(processes) as pool:
+            shards = pool.starmap(_count_shard, [(path, start, end, sensor_id_pos)
+                                                 for start, end in zip(bounds[:-1], bounds[1:])])
+
+        tcm = cls(sensor_id_pos=sensor_id_pos)
+        for shard in shards:
+            if shard is not None:
+                tcm._merge_counts(*shard)
+        return tcm
+
+    @classmethod
+    def from_file(cls, path, sensor_id_pos=SENSOR_ID_POS, use_cache=True):
         """
-        self.prob_matrix = {}
-        self.sensors_occurrences = {}
-        self._build_tcm(sensor_log, sensor_id_pos)
+        Build the topological compatibility matrix associated with the given sensor log, reusing the one stored in the
+        cache if the log has not changed since it was built (according to its size and modification time).
+        A columnar sensor log (see ColumnarSensorLog) is never cached, since it is not parsed.
 
-    def plot(self, threshold=None, show_values=False):
+        :type path: str
+        :type use_cache: bool
+        :param path: the path of the tab-separated file containing the sensor log (or the folder of its columnar
+        version).
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param use_cache: whether the cache has to be used or not.
+        :return: the topological compatibility matrix.
+        """
+        if os.path.isdir(path):
+            return cls(ColumnarSensorLog(path), sensor_id_pos=sensor_id_pos)
+
+        if not use_cache:
+            with open(path, 'rb') as sensor_log:
+                return cls(sensor_log, sensor_id_pos=sensor_id_pos)
+
+        path = os.path.abspath(path)
+        log_stat = os.stat(path)
+        fingerprint = FILENAME_SEPARATOR.join(str(x) for x in (log_stat.st_size, log_stat.st_mtime_ns, sensor_id_pos))
+        cache_key = hashlib.sha1(FILENAME_SEPARATOR.join([path, str(sensor_id_pos)]).encode()).hexdigest()
+        cache_path = os.path.join(TCM_CACHE_FOLDER, cache_key + NPZ_EXT)
+
+        if os.path.isfile(cache_path):
+            tcm = cls.load(cache_path, fingerprint=fingerprint)
+            if tcm is not None:
+                return tcm
+
+        with open(path, 'rb') as sensor_log:
+            tcm = cls(sensor_log, sensor_id_pos=sensor_id_pos)
+        os.makedirs(TCM_CACHE_FOLDER, exist_ok=True)
+        tcm.save(cache_path, fingerprint=fingerprint)
+        return tcm
+
+    def save(self, path, fingerprint=''):
+        """
+        Store the succession counters in a compressed binary file, together with the given fingerprint of the log
+        they come from.
+
+        :type path: str
+        :type fingerprint: str
+        :param path: the path of the file.
+        :param fingerprint: the string that identifies the log.
+        """
+        predecessors = np.repeat(np.arange(len(self._counts), dtype=np.int64), [len(row) for row in self._counts])
+        successors = np.fromiter(chain.from_iterable(self._counts), dtype=np.int64, count=len(predecessors))
+        counts = np.fromiter(chain.from_iterable(row.values() for row in self._counts), dtype=np.int64,
+                             count=len(predecessors))
+
+        # write to a temporary file first, so that a concurrent reader never finds a partial file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as dump:
+            np.savez_compressed(dump, sensors=np.asarray(self.sensors, dtype=np.str_),
+                                occurrences=self._occurrences[:len(self.sensors)], predecessors=predecessors,
+                                successors=successors, counts=counts,
+                                last_code=-1 if self._last_code is None else self._last_code,
+                                sensor_id_pos=self.sensor_id_pos, fingerprint=fingerprint)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Restore the topological compatibility matrix stored in the given file.
+
+        :type path: str
+        :type fingerprint: str
+        :param path: the path of the file.
+        :param fingerprint: the string that identifies the expected log (if None, it is not checked).
+        :return: the topological compatibility matrix (None if the stored fingerprint does not match).
+        """
+        with np.load(path) as dump:
+            if fingerprint is not None and str(dump['fingerprint']) != fingerprint:
+                return None
+            tcm = cls(sensor_id_pos=int(dump['sensor_id_pos']))
+            for sensor in dump['sensors'].tolist():
+                tcm._intern_sensor(sensor)
+            tcm._reserve(len(tcm.sensors))
+            tcm._occurrences[:len(tcm.sensors)] = dump['occurrences']
+            tcm._add_successions(dump['predecessors'].tolist(), dump['successors'].tolist(), dump['counts'].tolist())
+            last_code = int(dump['last_code'])
+
+        tcm._last_code = None if last_code < 0 else last_code
+        tcm._dirty_rows.update(range(len(tcm.sensors)))
+        return tcm
+
+    def plot(self, threshold=None, show_values=False, dense=False):
         """
         Plot the topological compatibility matrix, either probabilistic or deterministic version (if threshold is set).
-        Optionally, cells' values can be shown.
+        Optionally, cells' values can be shown. Only the non-zero cells are drawn, unless the dense heatmap is
+        requested (that requires to build the whole matrix).
 
         :type threshold: float
         :type show_values: bool
+        :type dense: bool
         :param threshold: a value between 0 and 1.
-        :param show_values: a flag stating whether the cells' values must be shown or not. 
+        :param show_values: a flag stating whether the cells' values must be shown or not.
+        :param dense: a flag stating whether the dense heatmap must be drawn.
         """
         if threshold:
             if threshold < 0 or threshold > 1:
                 raise ValueError(self.THRESHOLD_ERROR)
-            df = pd.DataFrame(self._get_deterministic_matrix(threshold))
+            matrix = self._get_deterministic_matrix(threshold)
         else:
-            df = pd.DataFrame(self.prob_matrix)
-        df = df.T  # transpose the DataFrame to consider the keys of prob_matrix dict as rows
+            matrix = self.prob_matrix
 
         fig = plt.figure()
         if show_values:
             plt.get_current_fig_manager().window.showMaximized()
 
-        sn.heatmap(df, vmin=0.0, vmax=1.0, annot=show_values, square=(not show_values), cmap='Reds', linewidths=1)
+        if dense:
+            sn.heatmap(self._get_dataframe(matrix), vmin=0.0, vmax=1.0, annot=show_values, square=(not show_values),
+                       cmap='Reds', linewidths=1)
+        else:
+            self._plot_sparse(matrix, show_values)
         plt.ylabel('predecessor')
         plt.yticks(rotation=self.Y_LABELS_ROT)
         plt.xlabel('successor')
@@ -56,78 +338,262 @@ class TopologicalCompatMatrix(object):
 
     """ UTILITY FUNCTIONS """
 
-    def _build_tcm(self, sensor_log, sensor_id_pos):
+    def _add_codes(self, codes):
         """
-        Build the topological compatibility matrix associated with the given sensor log.
-        
-        :type sensor_log: file
-        :param sensor_log: the tab-separated file containing the sensor log.
-        :param sensor_id_pos: the position of the sensor id in the log entry.
+        Update the succession counters with the given sequence of sensors codes, including the succession between the
+        last sensor seen so far and the first one of the sequence. The cost depends only on the sequence length.
+
+        :type codes: numpy.ndarray
+        :param codes: the codes of the sensors, in the order they appear in the log.
+        """
+        if not len(codes):
+            return
+        self._reserve(len(self.sensors))
+        self._occurrences += np.bincount(codes, minlength=len(self._occurrences))
+
+        if self._last_code is not None:
+            codes = np.concatenate(([self._last_code], codes))
+        self._last_code = int(codes[-1])
+
+        # encode each pair of consecutive codes (predecessor, successor) as a single cell index
+        sensors_num = len(self.sensors)
+        cells, cells_counts = np.unique(codes[:-1] * sensors_num + codes[1:], return_counts=True)
+        predecessors, successors = np.divmod(cells, sensors_num)
+        self._add_successions(predecessors.tolist(), successors.tolist(), cells_counts.tolist())
+
+        # both the counters of predecessors and the occurrences of all sensors in the sequence have changed
+        self._dirty_rows.update(np.unique(codes).tolist())
+
+    def _merge_counts(self, sensors, counts, occurrences, first_sensor, last_sensor):
+        """
+        Merge the given partial counters, computed over a portion of the log that immediately follows the ones already
+        considered. The succession between the last sensor seen so far and the first one of the portion is counted.
+
+        :type sensors: list
+        :type counts: list
+        :type occurrences: numpy.ndarray
+        :param sensors: the sensors ids of the portion, the position of each id is its code in the partial counters.
+        :param counts: the partial non-zero succession counters of each row.
+        :param occurrences: the partial sensors occurrences.
+        :param first_sensor: the id of the first sensor of the portion.
+        :param last_sensor: the id of the last sensor of the portion.
+        """
+        codes = [self._intern_sensor(sensor) for sensor in sensors]
+        self._reserve(len(self.sensors))
+        self._occurrences[codes] += occurrences
+        for code, row_counts in zip(codes, counts):
+            self._add_successions([code] * len(row_counts), [codes[col] for col in row_counts], row_counts.values())
+        self._dirty_rows.update(codes)
+
+        if self._last_code is not None:
+            self._add_successions([self._last_code], [self.sensor_codes[first_sensor]], [1])
+            self._dirty_rows.add(self._last_code)
+        self._last_code = self.sensor_codes[last_sensor]
+
+    def _add_successions(self, predecessors, successors, counts):
         """
-        sensor_log_reader = csv.reader(sensor_log, delimiter=LOG_ENTRY_DELIMITER)
+        Increase the counters of the given successions.
 
-        s0 = next(sensor_log_reader, None)  # consider a sliding window of two events per step
-        s1 = next(sensor_log_reader, None)
-        self.sensors_occurrences[s0[sensor_id_pos]] = 1
-        while s0 is not None and s1 is not None:
-            s0_id = s0[sensor_id_pos]
-            s1_id = s1[sensor_id_pos]
+        :param predecessors: the codes of the predecessors.
+        :param successors: the codes of the successors.
+        :param counts: the number of occurrences of each succession.
+        """
+        for predecessor, successor, count in zip(predecessors, successors, counts):
+            row_counts = self._counts[predecessor]
+            row_counts[successor] = row_counts.get(successor, 0) + count
 
-            # increase sensor occurrences
-            try:
-                self.sensors_occurrences[s1_id] += 1
-            except KeyError:
-                self.sensors_occurrences[s1_id] = 1
+    def _reserve(self, size):
+        """
+        Make room in the occurrences counters for the given number of sensors, doubling their capacity if needed.
+
+        :type size: int
+        :param size: the number of sensors.
+        """
+        capacity = len(self._occurrences)
+        if size <= capacity:
+            return
+        new_capacity = max(size, 2 * capacity, self.MIN_CAPACITY)
+
+        occurrences = np.zeros(new_capacity, dtype=np.int64)
+        occurrences[:capacity] = self._occurrences
+        self._occurrences = occurrences
+
+    def _normalize(self):
+        """
+        Normalize the values of the rows affected by the last updates with respect to predecessors total occurrences.
+        """
+        known_num = len(self._prob_rows)
+        if len(self.sensors) > known_num:
+            # add the rows for the new sensors (new sensors are always dirty)
+            new_sensors = self.sensors[known_num:]
+            self._prob_rows.update({sensor: SparseRow() for sensor in new_sensors})
+            self._prob_matrix_view = MappingProxyType({
+                sensor: MappingProxyType(row) for sensor, row in self._prob_rows.items()
+            })
+            for threshold, index in self._compat_indices.items():
+                if threshold == 0:
+                    for predecessors in index.values():
+                        predecessors.update(new_sensors)
+                    index.update({sensor: set(self.sensors) for sensor in new_sensors})
+                else:
+                    index.update({sensor: set() for sensor in new_sensors})
 
-            # add sensors ids to matrix and update succession counter
-            self._add_sensor(s0_id)
-            self._add_sensor(s1_id)
-            self.prob_matrix[s0_id][s1_id] += 1
+        for code in self._dirty_rows:
+            sensor = self.sensors[code]
+            occurrences = int(self._occurrences[code])
+            row = self._prob_rows[sensor]
+            new_row = {self.sensors[col]: count / occurrences for col, count in self._counts[code].items()}
 
-            # prepare next step (slide the window by one position)
-            s0 = s1
-            s1 = next(sensor_log_reader, None)
+            # move the sensor among the compatible predecessors of its new successors
+            for threshold, index in self._compat_indices.items():
+                if threshold == 0:
+                    continue
+                for col_id, value in row.items():
+                    if value >= threshold:
+                        index[col_id].discard(sensor)
+                for col_id, value in new_row.items():
+                    if value >= threshold:
+                        index[col_id].add(sensor)
 
-        for s_row in self.prob_matrix:
-            for s_col in self.prob_matrix[s_row]:
-                if self.prob_matrix[s_row][s_col] != 0:
-                    # normalize cell value with respect to predecessor total occurrences
-                    self.prob_matrix[s_row][s_col] /= self.sensors_occurrences[s_row]
+            row.clear()
+            row.update(new_row)
+        self._dirty_rows.clear()
 
-    def _add_sensor(self, sensor):
+    def _intern_sensor(self, sensor):
         """
-        Add to matrix a new row and a new column related to the given sensor (if not already existing).
-        
+        Return the code associated with the given sensor, assigning the next available one if the sensor is unknown.
+
         :type sensor: str
         :param sensor: the sensor identifier.
+        :return: the sensor code.
         """
-        if sensor in self.prob_matrix:
-            return  # the sensor is known, no need to add
-        if not self.prob_matrix:
-            # the matrix is empty, add the first sensor only
-            self.prob_matrix[sensor] = {sensor: 0}
-            return
-        # add a row for the new sensor
-        self.prob_matrix[sensor] = {key: 0 for key in self.prob_matrix.keys()}
-        # add a col for the new sensor
-        for s in self.prob_matrix.keys():
-            self.prob_matrix[s][sensor] = 0
+        try:
+            return self.sensor_codes[sensor]
+        except KeyError:
+            code = self.sensor_codes[sensor] = len(self.sensors)
+            self.sensors.append(sensor)
+            self._counts.append({})
+            return code
 
     def _get_deterministic_matrix(self, threshold):
         """
-        Build a deterministic copy of the (probabilistic) topological compatibility matrix where all cells whose value 
-        is greater or equal to the given threshold are set to 1 (0 otherwise).
-        
+        Build a deterministic copy of the (probabilistic) topological compatibility matrix where all cells whose value
+        is greater or equal to the given threshold are set to 1 (0 otherwise). Only the cells set to 1 are stored,
+        unless the threshold is 0 (in that case all the cells are set to 1, and the missing ones are worth 1).
+
         :type threshold: float
         :param threshold: a value between 0 and 1.
-        :return: a dict of dicts representing the deterministic matrix.
+        :return: a read-only dict of dicts representing the deterministic matrix.
         """
-        if threshold < 0 or threshold > 1:
-            raise ValueError(self.THRESHOLD_ERROR)
+        compat_index = self.get_compat_index(threshold)
+        default = 1 if threshold == 0 else 0
+        det_rows = {sensor: SparseRow(default=default) for sensor in self.sensors}
+        if threshold > 0:
+            for col_id, predecessors in compat_index.items():
+                for row_id in predecessors:
+                    det_rows[row_id][col_id] = 1
+        return MappingProxyType({row_id: MappingProxyType(row) for row_id, row in det_rows.items()})
+
+    def _get_dataframe(self, matrix):
+        """
+        Build the dense DataFrame of the given matrix, where rows are predecessors and columns are successors.
+
+        :param matrix: a dict of dicts representing a matrix with sparse rows.
+        :return: the DataFrame representing the matrix.
+        """
+        return pd.DataFrame([[matrix[row_id][col_id] for col_id in self.sensors] for row_id in self.sensors],
+                            index=self.sensors, columns=self.sensors)
+
+    def _plot_sparse(self, matrix, show_values):
+        """
+        Draw the non-zero cells of the given matrix on the current figure, where rows are predecessors and columns are
+        successors.
+
+        :type show_values: bool
+        :param matrix: a dict of dicts representing a matrix with sparse rows.
+        :param show_values: a flag stating whether the cells' values must be shown or not.
+        """
+        positions = []
+        values = []
+        for row_id, row in matrix.items():
+            for col_id, value in row.items():
+                positions.append((self.sensor_codes[col_id], self.sensor_codes[row_id]))
+                values.append(value)
+
+        ax = plt.gca()
+        cells = PatchCollection([Rectangle(position, 1, 1) for position in positions],
+                                cmap='Reds', edgecolor='white', linewidth=1)
+        cells.set_array(np.asarray(values, dtype=np.float64))
+        cells.set_clim(0.0, 1.0)
+        ax.add_collection(cells)
+        plt.colorbar(cells, ax=ax)
+
+        if show_values:
+            for (x, y), value in zip(positions, values):
+                ax.text(x + 0.5, y + 0.5, '%.2f' % value, ha='center', va='center')
+
+        sensors_num = len(self.sensors)
+        ticks = np.arange(sensors_num) + 0.5
+        ax.set_xlim(0, sensors_num)
+        ax.set_ylim(sensors_num, 0)  # the first row is on top (as in a heatmap)
+        ax.set_xticks(ticks)
+        ax.set_xticklabels(self.sensors)
+        ax.set_yticks(ticks)
+        ax.set_yticklabels(self.sensors)
+        if not show_values:
+            ax.set_aspect('equal')
+
+
+class SparseRow(dict):
+    __slots__ = ('default',)
+
+    def __init__(self, cells=(), default=0):
+        """
+        Row of a sparse matrix, storing only the explicit cells. A missing cell is worth the default value.
+
+        :param cells: the explicit cells, as a mapping from column id to value.
+        :param default: the value of the missing cells.
+        """
+        super(SparseRow, self).__init__(cells)
+        self.default = default
+
+    def __missing__(self, key):
+        return self.default
+
+
+def _count_shard(path, start, end, sensor_id_pos):
+    """
+    Count the successions in the portion of the given sensor log made of the entries starting within the given byte
+    range (to be run in a worker process).
+
+    :type path: str
+    :type start: int
+    :type end: int
+    :param path: the path of the tab-separated file containing the sensor log.
+    :param start: the first byte of the range.
+    :param end: the byte following the last one of the range.
+    :param sensor_id_pos: the position of the sensor id in the log entry.
+    :return: the partial counters and the first and last sensors ids of the portion (None if it is empty).
+    """
+    lines = []
+    with open(path, 'rb') as sensor_log:
+        if start > 0:
+            # skip the entry that starts in the previous range (if any)
+            sensor_log.seek(start - 1)
+            start += len(sensor_log.readline()) - 1
+        position = start
+        for line in sensor_log:
+            if position >= end:
+                break
+            lines.append(line)
+            position += len(line)
+
+    entries = list(csv.reader(lines, delimiter=LOG_ENTRY_DELIMITER))
+    if not entries:
+        return None
+    partial_tcm = TopologicalCompatMatrix(sensor_id_pos=sensor_id_pos)
+    partial_tcm.update(entries)
 
-        det_matrix = {}
-        for row in self.prob_matrix.keys():
-            det_matrix[row] = {}
-            for col in self.prob_matrix[row].keys():
-                det_matrix[row][col] = 1 if self.prob_matrix[row][col] >= threshold else 0
-        return det_matrix
+    sensors_num = len(partial_tcm.sensors)
+    return (partial_tcm.sensors, partial_tcm._counts, partial_tcm._occurrences[:sensors_num],
+            entries[0][sensor_id_pos], entries[-1][sensor_id_pos])
@@ -0,0 +1,169 @@
+import os
+from collections import deque
+from datetime import datetime
+
+from models.columnar_sensor_log import ColumnarSensorLog
+from models.topological_compat_matrix import TopologicalCompatMatrix
+from utils.constants import SENSOR_ID_POS, DATE_POS, TIME_POS
+
+
+class WindowedTopologicalCompatMatrix(TopologicalCompatMatrix):
+    WINDOW_ERROR = 'Either the maximum number of events or the maximum age of the window must be provided.'
+    PARTIAL_COUNTERS_ERROR = 'A sliding window cannot be built from partial counters, use from_file() instead.'
+    DUMP_ERROR = 'A sliding window cannot be stored, since the events in the window are not part of the dump.'
+
+    def __init__(self, sensor_log=None, sensor_id_pos=SENSOR_ID_POS, max_events=None, max_age=None,
+                 date_pos=DATE_POS, time_pos=TIME_POS):
+        """
+        Topological compatibility matrix associated with a sliding window over the given sensor log, s.t. it tracks
+        the recent behaviour only. The window contains either the last events (up to the given number) or the events
+        that are not older than the given time span with respect to the last one (or both).
+        Each event entering the window increases the counter of the succession with the previous one, while each
+        event leaving the window decreases the counter of the succession with the next one.
+
+        :type sensor_log: file | ColumnarSensorLog
+        :type max_events: int
+        :type max_age: datetime.timedelta
+        :param sensor_log: the tab-separated file containing the sensor log, or its columnar version (if None, an empty
+        matrix is built).
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param max_events: the maximum number of events in the window.
+        :param max_age: the maximum time span between the first and the last events in the window.
+        :param date_pos: the position of the date in the log entry (used only if max_age is set).
+        :param time_pos: the position of the time in the log entry (used only if max_age is set).
+        """
+        if not max_events and not max_age:
+            raise ValueError(self.WINDOW_ERROR)
+        self.max_events = max_events
+        self.max_age = max_age
+        self.date_pos = date_pos
+        self.time_pos = time_pos
+        self._window = deque()  # the codes and timestamps of the events in the window (oldest first).
+        super(WindowedTopologicalCompatMatrix, self).__init__(sensor_log=sensor_log, sensor_id_pos=sensor_id_pos)
+
+    def update(self, entries):
+        """
+        Slide the window over the given log entries, assuming that they immediately follow the ones already
+        considered. The cost is constant for each entry. The probabilistic matrix is normalized again only when
+        accessed.
+
+        :param entries: an iterable of log entries (e.g. the rows of a csv reader).
+        """
+        for entry in entries:
+            self.add_entry(entry)
+
+    def add_entry(self, entry):
+        """
+        Slide the window by one log entry, evicting the events that do not fit in the window anymore.
+
+        :type entry: list
+        :param entry: the log entry.
+        """
+        code = self._intern_sensor(entry[self.sensor_id_pos])
+        timestamp = None
+        if self.max_age:
+            timestamp = datetime.fromisoformat(entry[self.date_pos] + ' ' + entry[self.time_pos])
+        self._add_event(code, timestamp)
+
+    def update_from_columnar(self, columnar_log):
+        """
+        Slide the window over the events of the given columnar sensor log, assuming that they immediately follow the
+        ones already considered.
+
+        :type columnar_log: ColumnarSensorLog
+        :param columnar_log: the columnar sensor log.
+        """
+        codes_map = [self._intern_sensor(sensor) for sensor in columnar_log.sensors]
+        for _, code, timestamp in columnar_log.iter_events():
+            self._add_event(codes_map[code], columnar_log.to_datetime(timestamp) if self.max_age else None)
+
+    @classmethod
+    def from_file(cls, path, sensor_id_pos=SENSOR_ID_POS, max_events=None, max_age=None, date_pos=DATE_POS,
+                  time_pos=TIME_POS):
+        """
+        Build the topological compatibility matrix associated with a sliding window over the given sensor log, i.e.
+        with its last events. Unlike the matrix of the whole log, it is never cached (see save()).
+
+        :type path: str
+        :type max_events: int
+        :type max_age: datetime.timedelta
+        :param path: the path of the tab-separated file containing the sensor log (or the folder of its columnar
+        version).
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param max_events: the maximum number of events in the window.
+        :param max_age: the maximum time span between the first and the last events in the window.
+        :param date_pos: the position of the date in the log entry (used only if max_age is set).
+        :param time_pos: the position of the time in the log entry (used only if max_age is set).
+        :return: the topological compatibility matrix.
+        """
+        window = {'max_events': max_events, 'max_age': max_age, 'date_pos': date_pos, 'time_pos': time_pos}
+        if os.path.isdir(path):
+            return cls(ColumnarSensorLog(path), sensor_id_pos=sensor_id_pos, **window)
+        with open(path, 'rb') as sensor_log:
+            return cls(sensor_log, sensor_id_pos=sensor_id_pos, **window)
+
+    @classmethod
+    def from_file_parallel(cls, path, sensor_id_pos=SENSOR_ID_POS, processes=None):
+        """
+        Not supported: the successions leaving the window cannot be told apart in the partial counters of the shards.
+
+        :raises TypeError: always.
+        """
+        raise TypeError(cls.PARTIAL_COUNTERS_ERROR)
+
+    def save(self, path, fingerprint=''):
+        """
+        Not supported: the dump contains the succession counters only, so the window could not slide any further once
+        restored.
+
+        :raises TypeError: always.
+        """
+        raise TypeError(self.DUMP_ERROR)
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Not supported, see save().
+
+        :raises TypeError: always.
+        """
+        raise TypeError(cls.DUMP_ERROR)
+
+    """ UTILITY FUNCTIONS """
+
+    def _add_event(self, code, timestamp):
+        """
+        Slide the window by one event, evicting the events that do not fit in the window anymore.
+
+        :type code: int
+        :type timestamp: datetime
+        :param code: the code of the sensor of the event.
+        :param timestamp: the timestamp of the event (needed only if max_age is set).
+        """
+        self._reserve(len(self.sensors))
+        self._occurrences[code] += 1
+        self._dirty_rows.add(code)
+        if self._window:
+            last_code = self._window[-1][0]
+            self._add_successions([last_code], [code], [1])
+            self._dirty_rows.add(last_code)
+        self._window.append((code, timestamp))
+        self._last_code = code
+
+        while (self.max_events and len(self._window) > self.max_events) or \
+                (self.max_age and timestamp - self._window[0][1] > self.max_age):
+            self._evict()
+
+    def _evict(self):
+        """
+        Remove the oldest event from the window, together with its succession with the next one.
+        """
+        code, _ = self._window.popleft()
+        self._occurrences[code] -= 1
+        self._dirty_rows.add(code)
+        if self._window:
+            row_counts = self._counts[code]
+            successor = self._window[0][0]
+            row_counts[successor] -= 1
+            if not row_counts[successor]:
+                del row_counts[successor]  # keep only the non-zero cells
@@ -0,0 +1,73 @@
+import os
+
+from utils.constants import DATA_FOLDER, LOG_EXT, LOG_ENTRY_DELIMITER, SENSOR_ID_POS, DATE_POS, TIME_POS
+from utils.pipeline import Stage, NormalizeStage, FilterStateStage, TranslateSymbolsStage, ProjectColumnsStage, \
+    CsvWriterStage, LinesWriterStage, run_pipeline
+
+PREPROCESSED_OUTPUT = 'preprocessed'
+FILTERED_OUTPUT = 'filtered'
+SIMPLIFIED_OUTPUT = 'simplified'
+CSV_OUTPUT = 'csv'
+OUTPUTS = [PREPROCESSED_OUTPUT, FILTERED_OUTPUT, SIMPLIFIED_OUTPUT, CSV_OUTPUT]
+
+
+def prepare_sensor_log(sensor_log, outputs=None, complete=True, readable=True):
+    """
+    Prepare the given sensor log in a single pass, writing any subset of the files produced by the preparation
+    scripts at once. The files are the same (with the same names) of the ones produced by running the scripts in
+    sequence, i.e. preprocess_complete_sensor_log() (if the log is complete), filter_sensor_log(), then both
+    simplify_sensor_log() and convert_to_csv() on the filtered log.
+
+    :type sensor_log: file
+    :type outputs: list
+    :type complete: bool
+    :type readable: bool
+    :param sensor_log: the file containing the sensor log.
+    :param outputs: the files to be written (if None, all of them), among preprocessed (only if the log is
+    complete), filtered, simplified (together with its mapping) and csv.
+    :param complete: whether the log is complete (i.e. it has to be normalized) or it is already in the standard form.
+    :param readable: whether the mapping between sensor ids and letters has to be computed or not.
+    :return: the paths of the written files, by output.
+    """
+    outputs = outputs or OUTPUTS
+    file_basename = os.path.splitext(sensor_log.name)[0]
+    dests = {}
+    root = NormalizeStage() if complete else Stage()
+
+    if complete:
+        file_basename += '_preprocessed'
+        if PREPROCESSED_OUTPUT in outputs:
+            dests[PREPROCESSED_OUTPUT] = file_basename + LOG_EXT
+            root.then(CsvWriterStage(dests[PREPROCESSED_OUTPUT]))
+
+    file_basename += '_filtered'
+    filtered = root.then(FilterStateStage())
+    if FILTERED_OUTPUT in outputs:
+        dests[FILTERED_OUTPUT] = file_basename + LOG_EXT
+        filtered.then(CsvWriterStage(dests[FILTERED_OUTPUT]))
+
+    if SIMPLIFIED_OUTPUT in outputs:
+        dests[SIMPLIFIED_OUTPUT] = file_basename + '_simplified.txt'
+        translate = filtered.then(TranslateSymbolsStage(file_basename + '_simplified_dict.txt', readable=readable))
+        translate.then(ProjectColumnsStage([SENSOR_ID_POS])).then(LinesWriterStage(dests[SIMPLIFIED_OUTPUT]))
+
+    if CSV_OUTPUT in outputs:
+        dests[CSV_OUTPUT] = file_basename + '.csv'
+        filtered.then(ProjectColumnsStage([DATE_POS, TIME_POS, SENSOR_ID_POS])) \
+            .then(CsvWriterStage(dests[CSV_OUTPUT], delimiter=','))
+
+    run_pipeline(sensor_log, root, delimiter=NormalizeStage.DELIMITER if complete else LOG_ENTRY_DELIMITER)
+    return dests
+
+
+if __name__ == '__main__':
+    import time
+    from datetime import timedelta
+
+    SRC = os.path.join(DATA_FOLDER, 'complete_dataset.txt')
+
+    start_time = time.time()
+    with open(SRC, 'rb') as log:
+        for dest in prepare_sensor_log(log).values():
+            print(dest)
+    print('Preparation time:', timedelta(seconds=time.time() - start_time))
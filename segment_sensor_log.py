@@ -2,44 +2,57 @@ import os
 
 from models.segmented_sensor_log import SegmentedSensorLog
 from models.topological_compat_matrix import TopologicalCompatMatrix
+from sequence_classification.ngram_features import get_pairs_ngram_count_vectors
 from sequence_classification.sequence_classifier_input import SequenceClassifierInput
 from utils.constants import DATA_FOLDER
 
 GOOD_LABEL = 'GOOD'
 
 
-def build_sequence_clf_training_set(segmented_log, sensor_id_pos, ngrams_length):
+def build_sequence_clf_training_set(segmented_log, ngrams_length):
     print('Building training set...')
     sequences = []
     labels = []
     for segment_ in segmented_log.segments:
-        sequence = ''
-        for c in segment_:
-            sequence += c[sensor_id_pos]
-        sequences.append(sequence)
+        sequences.append(segmented_log.get_sequence(segment_))
         labels.append(GOOD_LABEL)
     clf_input = SequenceClassifierInput(sequences=sequences, labels=labels, ngrams_length=ngrams_length)
     train_data, *_ = clf_input.get_spectrum_train_test_data()
     return len(train_data[0])  # return the max sequence length
 
 
-def build_sequence_clf_validation_set(segmented_log, sensor_id_pos, ngrams_length, max_vector_length):
+def build_sequence_clf_validation_set(segmented_log, ngrams_length, max_vector_length):
     print('Building validation set...')
     sequences = []
     labels = []
     for b_step in segmented_log.b_steps:
         # compute the cartesian product of the two collections of segments in the current b step.
-        for segment_ in b_step.segments:
+        for segment_ in b_step.closed_segments:
             for compat_segment_ in b_step.compat_segments:
-                sequence = ''
-                for c in segment_ + compat_segment_:
-                    sequence += c[sensor_id_pos]
-                sequences.append(sequence)
+                sequences.append(segmented_log.get_sequence(segment_) + segmented_log.get_sequence(compat_segment_))
                 labels.append(GOOD_LABEL)
     clf_input = SequenceClassifierInput(sequences=sequences, labels=labels, ngrams_length=ngrams_length)
     clf_input.get_spectrum_train_test_data(max_vector_length)
 
 
+def build_sequence_clf_validation_vectors(segmented_log, ngrams_length, max_vector_length):
+    print('Building validation set...')
+    sequences = []
+    segments_rows = {}  # the position of each segment sequence, to compute its n-grams counts only once
+    pairs = []
+    for b_step in segmented_log.b_steps:
+        # compute the cartesian product of the two collections of segments in the current b step.
+        for segment_ in b_step.closed_segments + b_step.compat_segments:
+            if id(segment_) not in segments_rows:
+                segments_rows[id(segment_)] = len(sequences)
+                sequences.append(segmented_log.get_sequence(segment_))
+        for segment_ in b_step.closed_segments:
+            for compat_segment_ in b_step.compat_segments:
+                pairs.append((segments_rows[id(segment_)], segments_rows[id(compat_segment_)]))
+    # the n-grams count vectors of the pairs, composed from the ones of their segments
+    return get_pairs_ngram_count_vectors(sequences, pairs, ngrams_length, max_vector_length=max_vector_length)
+
+
 if __name__ == '__main__':
     import time
     from datetime import timedelta
@@ -56,8 +69,7 @@ if __name__ == '__main__':
     start_time = time.time()
 
     print('Building topological compatibility matrix...')
-    with open(SRC, 'rb') as log:
-        tcm = TopologicalCompatMatrix(sensor_log=log, sensor_id_pos=SENSOR_ID_POS_)
+    tcm = TopologicalCompatMatrix.from_file(SRC, sensor_id_pos=SENSOR_ID_POS_)
 
     print('Performing log segmentation...')
     with open(SRC, 'rb') as log:
@@ -69,19 +81,22 @@ if __name__ == '__main__':
 
     # show segments
     # from pprint import pprint
-    # pprint(ssl.segments)
+    # pprint([ssl.get_rows(s) for s in ssl.segments])
 
     # show b-steps
     # for b in ssl.b_steps:
-    #     pprint(b.segments)
-    #     pprint(b.compat_segments)
+    #     pprint([ssl.get_rows(s) for s in b.closed_segments])
+    #     pprint([ssl.get_rows(s) for s in b.compat_segments])
     #     print()
 
     # build a training set for a sequence classifier
-    # max_vector_length_ = build_sequence_clf_training_set(ssl, SENSOR_ID_POS_, NGRAMS_LENGTH)
+    # max_vector_length_ = build_sequence_clf_training_set(ssl, NGRAMS_LENGTH)
 
     # build a validation set for a sequence classifier
-    # build_sequence_clf_validation_set(ssl, SENSOR_ID_POS_, NGRAMS_LENGTH, max_vector_length_)
+    # build_sequence_clf_validation_set(ssl, NGRAMS_LENGTH, max_vector_length_)
+
+    # build the n-grams count vectors of a validation set for a sequence classifier
+    # validation_vectors = build_sequence_clf_validation_vectors(ssl, NGRAMS_LENGTH, max_vector_length_)
 
     # show segmented log statistics
     ssl.plot_stats()
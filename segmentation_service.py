@@ -0,0 +1,312 @@
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from statistics import quantiles
+
+from models.segmented_sensor_log import SegmentedSensorLog
+from models.topological_compat_matrix import TopologicalCompatMatrix
+from utils.constants import LOG_ENTRY_DELIMITER, SENSOR_ID_POS, NOISE_THRESHOLD
+
+LATENCY_SAMPLES_NUM = 100000
+SINK_MAX_PENDING = 10000
+LINES_PER_TURN = 64  # the lines of a connection segmented before giving the other connections a turn
+PERCENTILES_NUM = 100
+# the state of thousands of households makes full garbage collections long enough to stall the event loop, so they
+# are made less frequent (the state of the segmentations has no reference cycles)
+GC_THRESHOLDS = (50000, 20, 100)
+STOP_TIMEOUT = 10.  # the seconds the clients are given to close their connections when the service is stopped
+
+
+class SegmentationService(object):
+
+    def __init__(self, sink, compat_threshold, sensor_id_pos=SENSOR_ID_POS, noise_threshold=NOISE_THRESHOLD,
+                 max_idle=None, matrix_factory=TopologicalCompatMatrix):
+        """
+        Service that segments the sensor logs of many households at once, as their entries arrive over a socket.
+        Each line received is a log entry preceded by the id of its household (tab-separated, without quoting).
+        Each household has its own topological compatibility matrix, updated with each entry before segmenting it, and
+        its own incremental segmentation (see SegmentedSensorLog.add_entry()). The closed segments and the completed
+        B-steps are emitted to the sink as soon as they are available.
+        Backpressure is propagated end to end: a connection is not read while the sink is full, so the socket buffers
+        fill up and the clients are slowed down in turn.
+
+        :type sink: JsonLinesSink
+        :type compat_threshold: float
+        :type noise_threshold: int
+        :type max_idle: datetime.timedelta
+        :param sink: the sink where the results are emitted.
+        :param compat_threshold: the threshold to reach for a direct succession to be significant.
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        :param noise_threshold: the minimum length of a segment.
+        :param max_idle: the maximum time span without measures for a segment to be kept open (if None, segments are
+        closed only at B-steps).
+        :param matrix_factory: the callable that builds the empty matrix of a new household (e.g. a sliding-window one).
+        """
+        self.sink = sink
+        self.compat_threshold = compat_threshold
+        self.sensor_id_pos = sensor_id_pos
+        self.noise_threshold = noise_threshold
+        self.max_idle = max_idle
+        self.matrix_factory = matrix_factory
+
+        self.households = {}  # the segmentation of each household, by id.
+        self.events_num = 0
+        self.segments_num = 0
+        self.b_steps_num = 0
+        self.malformed_lines_num = 0
+        self.max_latency = 0.
+        self._entries_nums = {}  # the number of entries received for each household, by id.
+        self._total_latency = 0.
+        self._latencies = deque(maxlen=LATENCY_SAMPLES_NUM)  # the most recent latencies (in seconds).
+        self._servers = []
+        self._connections = set()  # the tasks handling the open connections.
+        self._idle_connections = set()  # the tasks waiting for the next line of their connection.
+        self._closing = False  # whether the connections have to be closed.
+
+    async def start(self, host=None, port=None, path=None):
+        """
+        Start accepting connections, either on the given TCP address or on the given Unix socket.
+
+        :type host: str
+        :type port: int
+        :type path: str
+        :param host: the host of the TCP address.
+        :param port: the port of the TCP address.
+        :param path: the path of the Unix socket (if given, the TCP address is ignored).
+        """
+        if path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        self._servers.append(server)
+
+    async def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Stop accepting connections and wait for the open ones to be closed by the clients, then close the open
+        segments of all the households and emit the results. The connections still open after the given time are
+        closed by the service, once the lines already received are segmented.
+
+        :type timeout: float
+        :param timeout: the seconds the clients are given to close their connections (if None, there is no limit).
+        """
+        for server in self._servers:
+            server.close()
+        self._servers.clear()
+
+        connections = list(self._connections)
+        if connections:
+            await asyncio.wait(connections, timeout=timeout)
+            self._closing = True
+            for task in self._idle_connections:
+                task.cancel()
+            # the connections segmenting a line stop before reading the next one
+            await asyncio.gather(*connections, return_exceptions=True)
+
+        for household_id, segmented_log in self.households.items():
+            await self._emit(household_id, segmented_log, [segmented_log.close_segments()])
+
+    async def handle_connection(self, reader, writer):
+        """
+        Segment the entries received over the given connection, one line at a time.
+
+        :type reader: asyncio.StreamReader
+        :type writer: asyncio.StreamWriter
+        """
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            lines_num = 0
+            while not self._closing:
+                self._idle_connections.add(task)
+                try:
+                    line = await reader.readline()
+                except asyncio.CancelledError:  # closed by stop()
+                    break
+                finally:
+                    self._idle_connections.discard(task)
+                if not line:
+                    break
+                lines_num += 1
+                if not lines_num % LINES_PER_TURN:
+                    # reading buffered lines never suspends, so a busy connection could delay the others
+                    await asyncio.sleep(0)
+                received_time = time.perf_counter()
+                try:
+                    household_id, *entry = line.decode().rstrip('\r\n').split(LOG_ENTRY_DELIMITER)
+                    segmented_log, results = self.add_entry(household_id, entry)
+                except (ValueError, IndexError) as e:  # e.g. not UTF-8, missing fields or invalid timestamp
+                    self.malformed_lines_num += 1
+                    print('Skipping malformed line %r: %s' % (line, e), file=sys.stderr)
+                    continue
+                if results:
+                    await self._emit(household_id, segmented_log, results)
+
+                latency = time.perf_counter() - received_time
+                self._total_latency += latency
+                self._latencies.append(latency)
+                if latency > self.max_latency:
+                    self.max_latency = latency
+        finally:
+            writer.close()
+            self._connections.discard(task)
+
+    def add_entry(self, household_id, entry):
+        """
+        Segment the given log entry of the given household.
+
+        :type household_id: str
+        :type entry: list
+        :param household_id: the household identifier.
+        :param entry: the log entry.
+        :return: the segmentation of the household and the results of closing segments meanwhile (see
+        SegmentedSensorLog.add_entry()).
+        """
+        # a malformed entry raises before changing the state (then the household of a malformed first entry is not
+        # added)
+        try:
+            segmented_log = self.households[household_id]
+        except KeyError:
+            segmented_log = SegmentedSensorLog(
+                top_compat_matrix=self.matrix_factory(sensor_id_pos=self.sensor_id_pos),
+                compat_threshold=self.compat_threshold, sensor_id_pos=self.sensor_id_pos,
+                noise_threshold=self.noise_threshold, update_matrix=True, lazy=True, max_idle=self.max_idle)
+            results = segmented_log.add_entry(entry, 0)
+            self.households[household_id] = segmented_log
+            self._entries_nums[household_id] = 1
+        else:
+            entries_num = self._entries_nums[household_id]
+            results = segmented_log.add_entry(entry, entries_num)
+            self._entries_nums[household_id] = entries_num + 1
+        self.events_num += 1
+        return segmented_log, results
+
+    def get_stats(self):
+        """
+        Return the statistics of the service, including the latency of the entries (from their reception to the
+        emission of the results), in milliseconds. Percentiles refer to the most recent entries.
+
+        :return: a dict containing the statistics.
+        """
+        stats = {
+            'households': len(self.households),
+            'events': self.events_num,
+            'segments': self.segments_num,
+            'b_steps': self.b_steps_num,
+            'malformed_lines': self.malformed_lines_num,
+            'avg_latency_ms': 1000 * self._total_latency / self.events_num if self.events_num else 0.,
+            'max_latency_ms': 1000 * self.max_latency,
+        }
+        if len(self._latencies) > 1:
+            percentiles = quantiles(self._latencies, n=PERCENTILES_NUM)
+            stats['p50_latency_ms'] = 1000 * percentiles[49]
+            stats['p99_latency_ms'] = 1000 * percentiles[98]
+        return stats
+
+    """ UTILITY FUNCTIONS """
+
+    async def _emit(self, household_id, segmented_log, results):
+        """
+        Emit the closed segments and the completed B-steps in the given results to the sink, waiting while it is full.
+
+        :type household_id: str
+        :type segmented_log: SegmentedSensorLog
+        :type results: list
+        :param household_id: the household identifier.
+        :param segmented_log: the segmentation of the household.
+        :param results: the results of closing segments.
+        """
+        for closed_segments, _, completed_b_steps in results:
+            for segment in closed_segments:
+                self.segments_num += 1
+                await self.sink.emit({'household': household_id, 'segment': segmented_log.get_sensor_ids(segment)})
+            for b_step in completed_b_steps:
+                self.b_steps_num += 1
+                await self.sink.emit({
+                    'household': household_id,
+                    'b_step': {
+                        'closed_segments': [segmented_log.get_sensor_ids(s) for s in b_step.closed_segments],
+                        'compat_segments': [segmented_log.get_sensor_ids(s) for s in b_step.compat_segments],
+                    },
+                })
+
+
+class JsonLinesSink(object):
+
+    def __init__(self, dest, max_pending=SINK_MAX_PENDING):
+        """
+        Sink that writes each record as a line of JSON to the given file, in a separate task. At most the given number
+        of records can be pending, then emit() waits for the writer to catch up.
+
+        :type max_pending: int
+        :param dest: the file where records are written (opened in text mode).
+        :param max_pending: the maximum number of records waiting to be written.
+        """
+        self.dest = dest
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._writer_task = None
+
+    def start(self):
+        """
+        Start writing the records (within the running event loop).
+        """
+        self._writer_task = asyncio.ensure_future(self._write_records())
+
+    async def emit(self, record):
+        """
+        Queue the given record to be written, waiting while too many records are pending.
+
+        :type record: dict
+        :param record: the record.
+        """
+        await self._queue.put(record)
+
+    async def stop(self):
+        """
+        Wait for the pending records to be written, then stop writing.
+        """
+        await self._queue.put(None)  # the writer stops after writing the records queued before
+        await self._writer_task
+        self.dest.flush()
+
+    async def _write_records(self):
+        """
+        Write the queued records, one per line, until None is queued.
+        """
+        while True:
+            record = await self._queue.get()
+            self._queue.task_done()
+            if record is None:
+                break
+            self.dest.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    import gc
+    import os
+
+    from utils.constants import DATA_FOLDER
+
+    PATH = os.path.join(DATA_FOLDER, 'segmentation_service.sock')  # see segmentation_test_client.py
+    COMPAT_THRESHOLD_ = 0.1
+
+    gc.set_threshold(*GC_THRESHOLDS)
+
+    async def main():
+        sink = JsonLinesSink(sys.stdout)
+        sink.start()
+        service = SegmentationService(sink, COMPAT_THRESHOLD_)
+        await service.start(path=PATH)
+        print('Listening on', PATH, file=sys.stderr)
+        try:
+            await asyncio.Event().wait()  # serve until interrupted
+        finally:
+            await service.stop()
+            await sink.stop()
+            print(service.get_stats(), file=sys.stderr)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
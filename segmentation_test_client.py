@@ -0,0 +1,98 @@
+import asyncio
+import random
+import time
+
+import unicodecsv as csv
+
+from utils.constants import LOG_ENTRY_DELIMITER
+
+LINES_PER_DRAIN = 256
+
+
+async def run_test_client(entries, households_num, events_num, connections_num=8, host=None, port=None, path=None,
+                          seed=None):
+    """
+    Stand-in for the households, that sends the given log entries to the segmentation service as if they were
+    produced by many households at once. Each household replays the entries from a random starting point, and the
+    households are spread over the connections, s.t. the entries of different households are interleaved.
+    The client waits whenever the service does not keep up (backpressure).
+
+    :type entries: list
+    :type households_num: int
+    :type events_num: int
+    :type connections_num: int
+    :type host: str
+    :type port: int
+    :type path: str
+    :param entries: the log entries to be replayed.
+    :param households_num: the number of households.
+    :param events_num: the number of entries to be sent for each household.
+    :param connections_num: the number of connections.
+    :param host: the host of the TCP address of the service.
+    :param port: the port of the TCP address of the service.
+    :param path: the path of the Unix socket of the service (if given, the TCP address is ignored).
+    :param seed: the seed of the random numbers generator (for reproducibility).
+    :return: the number of entries sent per second.
+    """
+    rnd = random.Random(seed)
+    lines = [LOG_ENTRY_DELIMITER.join(entry) for entry in entries]
+    starts = [rnd.randrange(len(lines)) for _ in range(households_num)]
+
+    async def send(households):
+        if path:
+            _, writer = await asyncio.open_unix_connection(path)
+        else:
+            _, writer = await asyncio.open_connection(host, port)
+        lines_num = 0
+        for i in range(events_num):
+            for household in households:
+                line = lines[(starts[household] + i) % len(lines)]
+                writer.write(('household%05d' % household + LOG_ENTRY_DELIMITER + line + '\n').encode())
+                lines_num += 1
+                if not lines_num % LINES_PER_DRAIN:
+                    await writer.drain()
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[send(range(c, households_num, connections_num)) for c in range(connections_num)])
+    return households_num * events_num / (time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    import gc
+    import os
+    import tempfile
+
+    from segmentation_service import SegmentationService, JsonLinesSink, GC_THRESHOLDS
+    from utils.constants import DATA_FOLDER
+
+    SRC = os.path.join(DATA_FOLDER, 'dataset_attivita_non_innestate_filtered.tsv')
+    COMPAT_THRESHOLD_ = 0.1
+    HOUSEHOLDS_NUM = 2000
+    EVENTS_NUM = 50
+    CONNECTIONS_NUM = 8
+
+    with open(SRC, 'rb') as log:
+        log_entries = list(csv.reader(log, delimiter=LOG_ENTRY_DELIMITER))
+
+    gc.set_threshold(*GC_THRESHOLDS)
+
+    async def main():
+        # run the service in the same event loop, on a temporary Unix socket
+        with tempfile.TemporaryDirectory() as tmp_dir, open(os.path.join(tmp_dir, 'results.jsonl'), 'w') as results:
+            path = os.path.join(tmp_dir, 'service.sock')
+            sink = JsonLinesSink(results)
+            sink.start()
+            service = SegmentationService(sink, COMPAT_THRESHOLD_)
+            await service.start(path=path)
+
+            throughput = await run_test_client(log_entries, HOUSEHOLDS_NUM, EVENTS_NUM,
+                                               connections_num=CONNECTIONS_NUM, path=path, seed=42)
+            await service.stop()
+            await sink.stop()
+            print('Throughput: %.0f events/s' % throughput)
+            print(service.get_stats())
+
+    asyncio.run(main())
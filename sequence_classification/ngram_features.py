@@ -0,0 +1,190 @@
+""" Module containing functions to build the n-grams count vectors of sequences (spectrum representation). """
+import numpy as np
+from scipy import sparse
+
+from sequence_classification.spectrum_kernel import flatten_dataset
+from utils.constants import PADDING_VALUE, SYMBOLS_DICT, BASE_TWO, SYMBOL_BITS
+
+# the code of each symbol, by ASCII value (-1 for unknown symbols)
+SYMBOLS_CODES = np.full(256, -1, dtype=np.int64)
+for _symbol, _bits in SYMBOLS_DICT.items():
+    SYMBOLS_CODES[ord(_symbol)] = int(_bits, BASE_TWO)
+
+
+def get_ngram_count_vectors(sequences, ngrams_length, max_vector_length=None):
+    """
+    Compute the n-grams count vectors of the given sequences, s.t. the column of each n-gram is its binary encoding.
+    N-grams are extracted and encoded as in SequenceClassifierInput.get_spectrum_train_test_data(), i.e. a sequence
+    not longer than n-grams length is a single n-gram and only the first n-grams are considered if a maximum number
+    is given. Like the spectrum kernel, the n-grams encoded as the padding value are ignored.
+
+    :type sequences: list
+    :type ngrams_length: int
+    :type max_vector_length: int
+    :param sequences: the list of sequences (strings of symbols).
+    :param ngrams_length: the length of a single n-gram.
+    :param max_vector_length: the maximum number of n-grams of each sequence (if None, all of them are considered).
+    :return: a sparse matrix (in CSR format) whose rows are the count vectors of the sequences.
+    """
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    codes = _get_symbols_codes(sequences)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    shape = (len(sequences), 1 << (SYMBOL_BITS * ngrams_length))
+
+    # encode all the n-grams of the concatenated sequences at once, then keep the ones within a single sequence
+    ngrams_num = max(len(codes) - ngrams_length + 1, 0)
+    ngrams = np.zeros(ngrams_num, dtype=np.int64)
+    for i in range(ngrams_length):
+        ngrams = (ngrams << SYMBOL_BITS) | codes[i:ngrams_num + i]
+    positions = np.arange(ngrams_num)
+    rows = np.searchsorted(ends, positions, side='right')
+    in_sequence = positions + ngrams_length <= ends[np.minimum(rows, len(ends) - 1)]
+    if max_vector_length:
+        in_sequence &= positions - starts[np.minimum(rows, len(starts) - 1)] < max_vector_length
+    rows = rows[in_sequence]
+    ngrams = ngrams[in_sequence]
+
+    # a short sequence is an n-gram itself
+    short = np.flatnonzero((lengths > 0) & (lengths < ngrams_length))
+    if len(short):
+        rows = np.concatenate([rows, short])
+        ngrams = np.concatenate([ngrams, _get_heads(codes, starts[short], lengths[short], lengths[short])])
+
+    return _to_count_matrix(rows, ngrams, shape)
+
+
+def get_encoded_ngram_count_vectors(data, ngrams_length):
+    """
+    Compute the n-grams count vectors of the given spectrum data (i.e. lists of encoded n-grams, as returned by
+    SequenceClassifierInput.get_spectrum_train_test_data()), with the same columns of get_ngram_count_vectors(). Since
+    the columns do not depend on the data, the vectors of different batches of data can be used together (e.g. to
+    train a model one batch at a time). The inner product of two vectors is the spectrum kernel of the sequences.
+
+    :type ngrams_length: int
+    :param data: the list of data (either a list of lists or a 2-D array).
+    :param ngrams_length: the length of a single n-gram.
+    :return: a sparse matrix (in CSR format) whose rows are the count vectors of the sequences.
+    """
+    rows, ngrams = flatten_dataset(data)
+    return _to_count_matrix(rows, ngrams, (len(data), 1 << (SYMBOL_BITS * ngrams_length)))
+
+
+def get_pairs_ngram_count_vectors(sequences, pairs, ngrams_length, max_vector_length=None, vectors=None):
+    """
+    Compute the n-grams count vectors of the concatenations of the given pairs of sequences, without building them.
+    The vector of a pair is the sum of the vectors of its sequences plus the n - 1 n-grams crossing their boundary.
+    The pairs involving sequences shorter than n-grams length or exceeding the maximum number of n-grams are built
+    explicitly instead. The result is the same of get_ngram_count_vectors() applied to the concatenations.
+
+    :type sequences: list
+    :type ngrams_length: int
+    :type max_vector_length: int
+    :type vectors: scipy.sparse.csr_matrix
+    :param sequences: the list of sequences (strings of symbols).
+    :param pairs: an array of shape (pairs_num, 2) containing the indices of the sequences of each pair.
+    :param ngrams_length: the length of a single n-gram.
+    :param max_vector_length: the maximum number of n-grams of each pair (if None, all of them are considered).
+    :param vectors: the count vectors of the sequences (computed if None), without a maximum number of n-grams.
+    :return: a sparse matrix (in CSR format) whose rows are the count vectors of the pairs.
+    """
+    if vectors is None:
+        vectors = get_ngram_count_vectors(sequences, ngrams_length)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    firsts, seconds = pairs[:, 0], pairs[:, 1]
+    firsts_lengths, seconds_lengths = lengths[firsts], lengths[seconds]
+
+    composable = (firsts_lengths >= ngrams_length) & (seconds_lengths >= ngrams_length)
+    if max_vector_length:
+        composable &= firsts_lengths + seconds_lengths - ngrams_length + 1 <= max_vector_length
+    composable_pairs = np.flatnonzero(composable)
+    other_pairs = np.flatnonzero(~composable)
+
+    # n-grams crossing the boundary, made of the last i symbols of the first sequence and the first n - i of the second
+    codes = _get_symbols_codes(sequences)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    firsts, seconds = firsts[composable_pairs], seconds[composable_pairs]
+    boundary_ngrams = []
+    for i in range(1, ngrams_length):
+        tails = _get_tails(codes, ends[firsts], i)
+        heads = _get_heads(codes, starts[seconds], ngrams_length - i, lengths[seconds])
+        boundary_ngrams.append((tails << (SYMBOL_BITS * (ngrams_length - i))) | heads)
+    rows = np.tile(np.arange(len(composable_pairs)), ngrams_length - 1)
+    boundary_ngrams = np.concatenate(boundary_ngrams) if boundary_ngrams else np.zeros(0, dtype=np.int64)
+    composed = vectors[firsts] + vectors[seconds] + _to_count_matrix(rows, boundary_ngrams,
+                                                                     (len(composable_pairs), vectors.shape[1]))
+
+    built = get_ngram_count_vectors([sequences[first] + sequences[second] for first, second in pairs[other_pairs]],
+                                    ngrams_length, max_vector_length=max_vector_length)
+
+    # restore the order of the pairs
+    order = np.empty(len(pairs), dtype=np.int64)
+    order[np.concatenate([composable_pairs, other_pairs])] = np.arange(len(pairs))
+    return sparse.vstack([composed, built], format='csr')[order]
+
+
+""" UTILITY FUNCTIONS """
+
+
+def _get_symbols_codes(sequences):
+    """
+    Return the codes of the symbols of the given sequences, concatenated.
+
+    :param sequences: the list of sequences (strings of symbols).
+    :return: an array of symbols codes.
+    """
+    codes = SYMBOLS_CODES[np.frombuffer(''.join(sequences).encode('latin-1'), dtype=np.uint8)]
+    if (codes < 0).any():
+        raise KeyError('Unknown symbols in sequences.')
+    return codes
+
+
+def _get_heads(codes, starts, length, lengths):
+    """
+    Encode the first symbols of the given sequences (as many as the given length, or the sequence length if shorter).
+
+    :param codes: the codes of the symbols of the concatenated sequences.
+    :param starts: the positions of the first symbols of the sequences.
+    :param length: the number of symbols to be encoded (an int or an array).
+    :param lengths: the lengths of the sequences.
+    :return: an array of codes.
+    """
+    length = np.minimum(length, lengths)
+    heads = np.zeros(len(starts), dtype=np.int64)
+    for i in range(int(np.max(length, initial=0))):
+        taken = i < length
+        heads[taken] = (heads[taken] << SYMBOL_BITS) | codes[starts[taken] + i]
+    return heads
+
+
+def _get_tails(codes, ends, length):
+    """
+    Encode the last symbols of the given sequences (assuming they are at least as many as the given length).
+
+    :param codes: the codes of the symbols of the concatenated sequences.
+    :param ends: the positions following the last symbols of the sequences.
+    :param length: the number of symbols to be encoded.
+    :return: an array of codes.
+    """
+    tails = np.zeros(len(ends), dtype=np.int64)
+    for i in range(length, 0, -1):
+        tails = (tails << SYMBOL_BITS) | codes[ends - i]
+    return tails
+
+
+def _to_count_matrix(rows, ngrams, shape):
+    """
+    Build the count vectors of the given n-grams occurrences, ignoring the n-grams encoded as the padding value.
+
+    :param rows: the row of each n-gram occurrence.
+    :param ngrams: the code of each n-gram occurrence.
+    :param shape: the shape of the matrix.
+    :return: a sparse matrix (in CSR format).
+    """
+    kept = ngrams != PADDING_VALUE
+    rows, ngrams = rows[kept], ngrams[kept]
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, ngrams)), shape=shape)
+    matrix.sum_duplicates()
+    return matrix
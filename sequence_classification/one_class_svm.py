@@ -0,0 +1,241 @@
+""" Module containing the One-class SVMs based on the Spectrum Kernel. """
+import numpy as np
+from sklearn import svm, linear_model
+
+from sequence_classification.ngram_features import get_encoded_ngram_count_vectors
+from sequence_classification.spectrum_kernel import sparse_spectrum_kernel, flatten_dataset
+from utils.constants import PADDING_VALUE
+
+STREAMING_BATCH_SIZE = 1000
+
+
+class PrecomputedOneClassSVM(object):
+
+    def __init__(self, **svm_params):
+        """
+        One-class SVM trained on a precomputed Spectrum Kernel matrix (e.g. sliced from the matrix stored next to the
+        dataset dump, see SequenceClassifierInput.get_spectrum_gram_matrix()), s.t. it can be trained many times
+        without computing kernels again.
+        Once trained, only the support vectors and their coefficients are kept: predictions compute the kernel
+        between the given data and the support vectors only, instead of the whole training set. It is a drop-in
+        replacement for a svm.OneClassSVM using a spectrum kernel function (for predictions).
+
+        :param svm_params: the parameters of the svm.OneClassSVM (e.g. nu), except for the kernel.
+        """
+        self.svm_params = svm_params
+        self.support_vectors = None
+        self.dual_coef = None
+        self.intercept = None
+
+    def fit(self, gram_matrix, data):
+        """
+        Train the model on the given kernel matrix.
+
+        :param gram_matrix: the kernel matrix of the training data (a 2-D array).
+        :param data: the training data (i.e. the rows of the kernel matrix).
+        :return: the model itself.
+        """
+        clf = svm.OneClassSVM(kernel='precomputed', **self.svm_params)
+        clf.fit(gram_matrix)
+        self.support_vectors = np.asarray([data[i] for i in clf.support_], dtype=np.int64)
+        self.dual_coef = clf.dual_coef_[0]
+        self.intercept = clf.intercept_[0]
+        return self
+
+    def decision_function(self, data):
+        """
+        Compute the signed distance of each sequence from the separating hyperplane.
+
+        :param data: the list of data.
+        :return: an array of distances (positive for inliers, negative for outliers).
+        """
+        return sparse_spectrum_kernel(data, self.support_vectors) @ self.dual_coef + self.intercept
+
+    def predict(self, data):
+        """
+        Predict whether each sequence is an inlier or an outlier, as the svm.OneClassSVM does.
+
+        :param data: the list of data.
+        :return: an array of predictions (+1 for inliers, -1 for outliers).
+        """
+        return np.where(self.decision_function(data) > 0, 1, -1)
+
+
+class StreamingOneClassSVM(object):
+
+    def __init__(self, ngrams_length, **sgd_params):
+        """
+        Linear One-class SVM on the explicit n-grams count vectors of the sequences (i.e. the features of the Spectrum
+        Kernel), trained by stochastic gradient descent one batch at a time. Unlike the kernel version, the training
+        time is linear in the number of sequences and the memory depends only on the batch size and on the number of
+        possible n-grams, so new data (e.g. the segments of a day) can be folded in without training from scratch (see
+        partial_fit()).
+
+        :type ngrams_length: int
+        :param ngrams_length: the length of a single n-gram.
+        :param sgd_params: the parameters of the linear_model.SGDOneClassSVM (e.g. nu).
+        """
+        self.ngrams_length = ngrams_length
+        self.clf = linear_model.SGDOneClassSVM(**sgd_params)
+
+    def partial_fit(self, data):
+        """
+        Update the model with the given batch of data.
+
+        :param data: the list of data.
+        :return: the model itself.
+        """
+        self.clf.partial_fit(get_encoded_ngram_count_vectors(data, self.ngrams_length))
+        return self
+
+    def fit(self, data, batch_size=STREAMING_BATCH_SIZE, epochs_num=1):
+        """
+        Update the model with the given data, one batch at a time (the count vectors of a batch at most are kept in
+        memory).
+
+        :type batch_size: int
+        :type epochs_num: int
+        :param data: the list of data (any sequence that can be sliced, e.g. a memory-mapped array).
+        :param batch_size: the number of sequences of each batch.
+        :param epochs_num: the number of passes over the data.
+        :return: the model itself.
+        """
+        for _ in range(epochs_num):
+            for start in range(0, len(data), batch_size):
+                self.partial_fit(data[start:start + batch_size])
+        return self
+
+    def decision_function(self, data):
+        """
+        Compute the signed distance of each sequence from the separating hyperplane.
+
+        :param data: the list of data.
+        :return: an array of distances (positive for inliers, negative for outliers).
+        """
+        return self.clf.decision_function(get_encoded_ngram_count_vectors(data, self.ngrams_length))
+
+    def predict(self, data):
+        """
+        Predict whether each sequence is an inlier or an outlier.
+
+        :param data: the list of data.
+        :return: an array of predictions (+1 for inliers, -1 for outliers).
+        """
+        return np.where(self.decision_function(data) > 0, 1, -1)
+
+
+class LinearSpectrumScorer(object):
+    TRAIN_DATA_ERROR = 'The data the model has been trained on must be provided, since svm.OneClassSVM does not ' \
+                       'store the support vectors when using a kernel function.'
+    KERNEL_ERROR = 'The model has not been trained with a spectrum kernel function.'
+    SHINGLES_KEY = 'shingles'
+    WEIGHTS_KEY = 'weights'
+    INTERCEPT_KEY = 'intercept'
+
+    def __init__(self, shingles, weights, intercept):
+        """
+        Compiled version of a One-class SVM trained with the spectrum kernel. Since the kernel is the inner product of
+        the shingles occurrences vectors, the decision function collapses to the inner product with a single weights
+        vector (i.e. the sum of the support vectors occurrences, weighted by their coefficients), plus the intercept.
+        Then a sequence is scored in time proportional to its length, whatever the number of support vectors is.
+
+        :param shingles: the shingles having a weight (a sorted array).
+        :param weights: the weight of each shingle.
+        :type intercept: float
+        :param intercept: the intercept of the decision function (i.e. -rho).
+        """
+        self.shingles = shingles
+        self.weights = weights
+        self.intercept = intercept
+        self._weights_dict = dict(zip(shingles.tolist(), weights.tolist()))
+
+    @classmethod
+    def from_model(cls, clf, train_data=None):
+        """
+        Compile the given trained model.
+
+        :param clf: either a PrecomputedOneClassSVM, a StreamingOneClassSVM or a svm.OneClassSVM using a spectrum
+        kernel function.
+        :param train_data: the data the model has been trained on, in the same order (needed only by a
+        svm.OneClassSVM).
+        :return: the scorer.
+        """
+        if isinstance(clf, StreamingOneClassSVM):
+            # the model is already linear, the columns of the weights are the shingles
+            shingles = np.flatnonzero(clf.clf.coef_)
+            return cls(shingles, clf.clf.coef_[shingles], -float(clf.clf.offset_[0]))
+        if isinstance(clf, PrecomputedOneClassSVM):
+            support_vectors, dual_coef, intercept = clf.support_vectors, clf.dual_coef, clf.intercept
+        elif callable(getattr(clf, 'kernel', None)):
+            # with a kernel function, only the positions of the support vectors in the training data are stored
+            if train_data is None or len(train_data) != clf.shape_fit_[0]:
+                raise ValueError(cls.TRAIN_DATA_ERROR)
+            support_vectors = [train_data[i] for i in clf.support_]
+            dual_coef, intercept = clf.dual_coef_[0], clf.intercept_[0]
+        else:
+            raise ValueError(cls.KERNEL_ERROR)
+        rows, shingles = flatten_dataset(support_vectors)
+        shingles, columns = np.unique(shingles, return_inverse=True)
+        weights = np.bincount(columns, weights=np.asarray(dual_coef, dtype=np.float64)[rows], minlength=len(shingles))
+        return cls(shingles, weights, float(intercept))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the scorer stored in the given file (see dump()).
+
+        :type path: str
+        :param path: the path of the file (in .npz format).
+        :return: the scorer.
+        """
+        with np.load(path) as archive:
+            return cls(archive[cls.SHINGLES_KEY], archive[cls.WEIGHTS_KEY], float(archive[cls.INTERCEPT_KEY]))
+
+    def dump(self, path):
+        """
+        Store the scorer in the given file.
+
+        :type path: str
+        :param path: the path of the file (in .npz format).
+        """
+        np.savez(path, **{
+            self.SHINGLES_KEY: self.shingles,
+            self.WEIGHTS_KEY: self.weights,
+            self.INTERCEPT_KEY: self.intercept,
+        })
+
+    def score(self, sequence):
+        """
+        Compute the signed distance of the given sequence from the separating hyperplane.
+
+        :param sequence: the list of encoded shingles of the sequence.
+        :return: the distance (positive for inliers, negative for outliers).
+        """
+        weights_dict = self._weights_dict
+        total = 0.
+        for shingle in sequence:
+            if shingle != PADDING_VALUE:
+                total += weights_dict.get(shingle, 0.)
+        return total + self.intercept
+
+    def decision_function(self, data):
+        """
+        Compute the signed distance of each sequence from the separating hyperplane, scoring all the sequences at once
+        (the result is the same of score()).
+
+        :param data: the list of data (either a list of lists or a 2-D array).
+        :return: an array of distances (positive for inliers, negative for outliers).
+        """
+        rows, shingles = flatten_dataset(data)
+        columns = np.minimum(np.searchsorted(self.shingles, shingles), max(len(self.shingles) - 1, 0))
+        found = self.shingles[columns] == shingles if len(self.shingles) else np.zeros(len(shingles), dtype=bool)
+        return np.bincount(rows[found], weights=self.weights[columns[found]], minlength=len(data)) + self.intercept
+
+    def predict(self, data):
+        """
+        Predict whether each sequence is an inlier or an outlier, as the compiled model does.
+
+        :param data: the list of data.
+        :return: an array of predictions (+1 for inliers, -1 for outliers).
+        """
+        return np.where(self.decision_function(data) > 0, 1, -1)
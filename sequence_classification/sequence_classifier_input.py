@@ -9,42 +9,14 @@ import klepto
 import time
 
 from sequence_classification import tf_glove
+from sequence_classification.spectrum_kernel import blocked_spectrum_kernel, KERNEL_BLOCK_SIZE
 from utils import persistence
 from utils.constants import \
     PADDING_VALUE, SPECTRUM_KEY, LABELS_KEY, INPUTS_PER_LABEL_KEY, TIME_KEY, RNN_SUFFIX, SPECTRUM_SUFFIX, \
     FILENAME_SEPARATOR, DATA_FOLDER, TRAIN_DATA_KEY, TEST_DATA_KEY, TRAIN_LABELS_KEY, TEST_LABELS_KEY, \
     TRAIN_DATA_POS, TEST_DATA_POS, TRAIN_LABELS_POS, TEST_LABELS_POS, GLOVE_TRAIN_SUFFIX, GLOVE_TEST_SUFFIX, \
-    GLOVE_EMBEDDING_SIZE_KEY, MAX_COLS_NUM_KEY
-
-BASE_TWO = 2
-SYMBOLS_DICT = {
-    'A': '00000',
-    'B': '00001',
-    'C': '00010',
-    'D': '00011',
-    'E': '00100',
-    'F': '00101',
-    'G': '00110',
-    'H': '00111',
-    'I': '01000',
-    'J': '01001',
-    'K': '01010',
-    'L': '01011',
-    'M': '01100',
-    'N': '01101',
-    'O': '01110',
-    'P': '01111',
-    'Q': '10000',
-    'R': '10001',
-    'S': '10010',
-    'T': '10011',
-    'U': '10100',
-    'V': '10101',
-    'W': '10110',
-    'X': '10111',
-    'Y': '11000',
-    'Z': '11001'
-}
+    GLOVE_EMBEDDING_SIZE_KEY, MAX_COLS_NUM_KEY, GRAM_SUFFIX, NPY_EXT, SYMBOLS_DICT, BASE_TWO
+
 EMBEDDING_SIZE = 100
 
 
@@ -209,6 +181,25 @@ class SequenceClassifierInput(object):
         self._dump_dataset(split_dataset, suffix=SPECTRUM_SUFFIX)
         return split_dataset
 
+    def get_spectrum_gram_matrix(self, data, block_size=KERNEL_BLOCK_SIZE, processes=None):
+        """
+        Return the Spectrum Kernel matrix of the given data (see blocked_spectrum_kernel()), stored next to the dataset
+        dump. The matrix is computed only the first time (or resumed, if its computation was interrupted), then it is
+        loaded from secondary storage as long as the data match the fingerprint stored with it, s.t. models can be
+        trained on any subset of the data by slicing it (see slice_packed_matrix()).
+
+        :type block_size: int
+        :type processes: int
+        :param data: the spectrum data of the dataset (e.g. both the splits of get_spectrum_train_test_data()).
+        :param block_size: the number of rows and columns of a block.
+        :param processes: the number of processes (if None, the number of CPUs).
+        :return: the upper triangle of the kernel matrix, packed by rows and memory-mapped (read-only).
+        """
+        filename = os.path.join(DATA_FOLDER,
+                                FILENAME_SEPARATOR.join([self.dump_basename, SPECTRUM_SUFFIX, GRAM_SUFFIX]) + NPY_EXT)
+        return blocked_spectrum_kernel(filename, data, block_size=block_size, processes=processes,
+                                       verbose=self.progress)
+
     def _get_training_inputs_by_labels(self):
         """
         Retrieve training pairs given a list of relevant labels.
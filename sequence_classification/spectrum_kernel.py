@@ -1,7 +1,21 @@
 """ Module containing various kernel functions for sequence classification problem. """
+import hashlib
+import json
+import multiprocessing
+import os
+import time
 from collections import Counter
+from datetime import timedelta
+from itertools import chain
 
-from utils.constants import PADDING_VALUE
+import numpy as np
+from scipy import sparse
+
+from utils.constants import PADDING_VALUE, JSON_EXT, SYMBOL_BITS, ALPHABET_SIZE
+
+KERNEL_BLOCK_SIZE = 2000
+PROGRESS_SUFFIX = '.progress'
+FINGERPRINT_SUFFIX = '.fingerprint'
 
 
 def occurrence_dict_spectrum_kernel(rows_data, cols_data):
@@ -61,3 +75,436 @@ def precomputed_occurrence_dict_spectrum_kernel(data):
             kernel_matrix[row_num][col_num] = kernel
             kernel_matrix[col_num][row_num] = kernel
     return kernel_matrix
+
+
+def sparse_spectrum_kernel(rows_data, cols_data):
+    """
+    Compute the Spectrum Kernel matrix as the product of the sparse matrices of the shingles occurrences of the rows
+    and of the columns, s.t. each sequence is converted once. It is a drop-in replacement for
+    occurrence_dict_spectrum_kernel().
+
+    :param rows_data: the list of data corresponding to the rows of the kernel matrix.
+    :param cols_data: the list of data corresponding to the columns of the kernel matrix.
+    :return: a 2-D array representing the kernel matrix.
+    """
+    rows_vectors, cols_vectors = get_occurrences_vectors(rows_data, cols_data)
+    return (rows_vectors @ cols_vectors.T).toarray()
+
+
+def precomputed_sparse_spectrum_kernel(data):
+    """
+    Compute the Spectrum Kernel matrix as the product of the sparse matrix of the shingles occurrences by its
+    transpose, assuming that the same dataset is used for both the rows and the columns of the matrix. It is a drop-in
+    replacement for precomputed_occurrence_dict_spectrum_kernel().
+
+    :param data: the list of data corresponding to both the rows and the columns of the kernel matrix.
+    :return: a 2-D array representing the kernel matrix.
+    """
+    vectors, = get_occurrences_vectors(data)
+    return (vectors @ vectors.T).toarray()
+
+
+def mismatch_spectrum_kernel(rows_data, cols_data, ngrams_length, max_mismatches=1, alphabet_size=ALPHABET_SIZE):
+    """
+    Compute the (k, m)-mismatch Spectrum Kernel matrix, i.e. the inner product of the vectors counting, for each
+    possible shingle, the shingles of a sequence that differ from it in at most the given number of symbols. Then a
+    sequence with a spurious symbol still shares most of its features with the original one (without mismatches, it is
+    the Spectrum Kernel). The kernel is computed as the product of the sparse matrices of the shingles occurrences and
+    of the similarities between the shingles (see get_mismatch_similarities()).
+    To be used as the kernel of a classifier, the shingles length and the number of mismatches have to be bound (e.g.
+    with functools.partial).
+
+    :type ngrams_length: int
+    :type max_mismatches: int
+    :type alphabet_size: int
+    :param rows_data: the list of data corresponding to the rows of the kernel matrix.
+    :param cols_data: the list of data corresponding to the columns of the kernel matrix.
+    :param ngrams_length: the number of symbols of each shingle.
+    :param max_mismatches: the maximum number of mismatching symbols.
+    :param alphabet_size: the number of symbols.
+    :return: a 2-D array representing the kernel matrix.
+    """
+    rows_vectors, cols_vectors, shingles = get_occurrences_vectors(rows_data, cols_data, return_columns=True)
+    similarities = get_mismatch_similarities(shingles, ngrams_length, max_mismatches, alphabet_size)
+    return ((rows_vectors @ similarities) @ cols_vectors.T).toarray()
+
+
+def precomputed_mismatch_spectrum_kernel(data, ngrams_length, max_mismatches=1, alphabet_size=ALPHABET_SIZE):
+    """
+    Compute the (k, m)-mismatch Spectrum Kernel matrix (see mismatch_spectrum_kernel()), assuming that the same
+    dataset is used for both the rows and the columns of the matrix.
+
+    :type ngrams_length: int
+    :type max_mismatches: int
+    :type alphabet_size: int
+    :param data: the list of data corresponding to both the rows and the columns of the kernel matrix.
+    :param ngrams_length: the number of symbols of each shingle.
+    :param max_mismatches: the maximum number of mismatching symbols.
+    :param alphabet_size: the number of symbols.
+    :return: a 2-D array representing the kernel matrix.
+    """
+    vectors, shingles = get_occurrences_vectors(data, return_columns=True)
+    similarities = get_mismatch_similarities(shingles, ngrams_length, max_mismatches, alphabet_size)
+    return ((vectors @ similarities) @ vectors.T).toarray()
+
+
+def get_mismatch_similarities(shingles, ngrams_length, max_mismatches=1, alphabet_size=ALPHABET_SIZE):
+    """
+    Compute the similarity of each pair of the given shingles, i.e. the number of possible shingles that differ from
+    both in at most the given number of symbols.
+    The possible shingles are the leaves of a trie, traversed depth-first keeping the given shingles that are still
+    within the maximum number of mismatches: a branch is pruned as soon as no shingle is left. Since the symbols that
+    do not occur at the current position of any of the shingles left lead to identical subtrees, they are traversed
+    once and the resulting leaves are weighted by their number. Then the cost depends on the given shingles, rather
+    than on the size of the alphabet.
+
+    :type ngrams_length: int
+    :type max_mismatches: int
+    :type alphabet_size: int
+    :param shingles: the distinct encoded shingles (an array).
+    :param ngrams_length: the number of symbols of each shingle.
+    :param max_mismatches: the maximum number of mismatching symbols.
+    :param alphabet_size: the number of symbols.
+    :return: a sparse matrix (in CSR format), whose rows and columns are the given shingles.
+    """
+    shifts = SYMBOL_BITS * np.arange(ngrams_length - 1, -1, -1)
+    symbols = (np.asarray(shingles, dtype=np.int64)[:, np.newaxis] >> shifts) & ((1 << SYMBOL_BITS) - 1)
+
+    leaves_shingles = []
+    weights = []
+    _traverse_mismatch_trie(symbols, np.arange(len(symbols)), np.zeros(len(symbols), dtype=np.int64), 0, 1,
+                            max_mismatches, alphabet_size, leaves_shingles, weights)
+
+    # the leaves where each shingle is found, then the (weighted) leaves shared by each pair of shingles
+    lengths = np.fromiter(map(len, leaves_shingles), dtype=np.int64, count=len(leaves_shingles))
+    leaves = sparse.csr_matrix((np.repeat(np.asarray(weights, dtype=np.int64), lengths),
+                                (np.concatenate(leaves_shingles or [np.empty(0, dtype=np.int64)]),
+                                 np.repeat(np.arange(len(leaves_shingles)), lengths))),
+                               shape=(len(symbols), len(leaves_shingles)))
+    return leaves @ (leaves != 0).T.astype(np.int64)
+
+
+def get_occurrences_vectors(*datasets, return_columns=False):
+    """
+    Convert each sequence of the given datasets (i.e. a list of encoded shingles) in a sparse row of shingles
+    occurrences, ignoring the padding value. The columns are shared by all the datasets, but only the shingles
+    occurring in at least one of them have a column (then the matrices are as narrow as possible, whatever the
+    shingles length is).
+
+    :type return_columns: bool
+    :param datasets: the lists of data (either lists of lists or 2-D arrays).
+    :param return_columns: whether the shingle of each column has to be returned too.
+    :return: a list of sparse matrices (in CSR format), one for each dataset, followed by the array of the shingle of
+    each column if required.
+    """
+    rows, shingles = zip(*[flatten_dataset(data) for data in datasets])
+    columns = np.unique(np.concatenate(shingles))
+    vectors = []
+    for data, data_rows, data_shingles in zip(datasets, rows, shingles):
+        matrix = sparse.csr_matrix((np.ones(len(data_rows), dtype=np.int64),
+                                    (data_rows, np.searchsorted(columns, data_shingles))),
+                                   shape=(len(data), len(columns)))
+        matrix.sum_duplicates()
+        vectors.append(matrix)
+    if return_columns:
+        vectors.append(columns)
+    return vectors
+
+
+def flatten_dataset(data):
+    """
+    Flatten the given dataset, dropping the padding value (e.g. to process the shingles of all the sequences at
+    once).
+
+    :param data: the list of data (either a list of lists or a 2-D array).
+    :return: a tuple made of the row of each shingle and the shingles.
+    """
+    if isinstance(data, np.ndarray) and data.ndim == 2:
+        lengths = np.full(data.shape[0], data.shape[1], dtype=np.int64)
+        shingles = data.ravel()
+    else:
+        lengths = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+        shingles = np.asarray(list(chain.from_iterable(data)))
+    shingles = shingles.astype(np.int64)  # e.g. scikit-learn casts data to float
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    kept = shingles != PADDING_VALUE
+    return rows[kept], shingles[kept]
+
+
+def blocked_spectrum_kernel(dest, rows_data, cols_data=None, block_size=KERNEL_BLOCK_SIZE, processes=None,
+                            verbose=True):
+    """
+    Compute the Spectrum Kernel matrix out of core, writing it to a memory-mapped file (float32, in .npy format).
+    The matrix is tiled into square blocks, computed by a pool of processes (see sparse_spectrum_kernel()) and written
+    directly to the file. If the columns data are not provided, the matrix is symmetric and only its upper triangle is
+    computed and stored, packed by rows (see get_packed_index() and unpack_upper_triangular()).
+    The completed blocks are recorded in a progress file next to the matrix, so that an interrupted computation is
+    resumed from the missing blocks (as long as data and block size do not change). At the end, the progress file is
+    replaced by a fingerprint of the data, so that the stored matrix is returned without computing it again as long as
+    it is requested for the same data (e.g. to train many models on the same dataset).
+
+    :type dest: str
+    :type block_size: int
+    :type processes: int
+    :type verbose: bool
+    :param dest: the path of the file where the matrix is stored.
+    :param rows_data: the list of data corresponding to the rows of the kernel matrix.
+    :param cols_data: the list of data corresponding to the columns of the kernel matrix (if None, the same of rows).
+    :param block_size: the number of rows and columns of a block.
+    :param processes: the number of processes (if None, the number of CPUs).
+    :param verbose: whether the progress has to be reported or not.
+    :return: the kernel matrix, memory-mapped (read-only).
+    """
+    symmetric = cols_data is None
+    if symmetric:
+        rows_vectors, = get_occurrences_vectors(rows_data)
+        cols_vectors = rows_vectors
+        shape = (rows_vectors.shape[0] * (rows_vectors.shape[0] + 1) // 2,)
+    else:
+        rows_vectors, cols_vectors = get_occurrences_vectors(rows_data, cols_data)
+        shape = (rows_vectors.shape[0], cols_vectors.shape[0])
+
+    rows_starts = range(0, rows_vectors.shape[0], block_size)
+    cols_starts = range(0, cols_vectors.shape[0], block_size)
+    blocks = [(row_start, col_start) for row_start in rows_starts for col_start in cols_starts
+              if not symmetric or col_start >= row_start]
+
+    # reuse the stored matrix if it has been computed for the same data
+    fingerprint = _get_vectors_fingerprint(rows_vectors, cols_vectors)
+    fingerprint_path = dest + FINGERPRINT_SUFFIX + JSON_EXT
+    try:
+        with open(fingerprint_path) as fingerprint_file:
+            stored_fingerprint = json.load(fingerprint_file)
+        if stored_fingerprint['fingerprint'] == fingerprint and tuple(stored_fingerprint['shape']) == shape and \
+                os.path.isfile(dest):
+            return np.load(dest, mmap_mode='r')
+    except FileNotFoundError:
+        pass
+
+    # resume the computation if the progress file matches the current one
+    progress_path = dest + PROGRESS_SUFFIX + JSON_EXT
+    progress = {
+        'fingerprint': fingerprint,
+        'block_size': block_size,
+        'shape': shape,
+        'done': [],
+    }
+    try:
+        with open(progress_path) as progress_file:
+            old_progress = json.load(progress_file)
+        if all(old_progress[key] == progress[key] for key in ('fingerprint', 'block_size')) and \
+                tuple(old_progress['shape']) == shape and os.path.isfile(dest):
+            progress['done'] = old_progress['done']
+    except FileNotFoundError:
+        pass
+
+    if not progress['done']:
+        if os.path.isfile(fingerprint_path):
+            os.remove(fingerprint_path)  # the stored matrix is about to be overwritten
+        np.lib.format.open_memmap(dest, mode='w+', dtype=np.float32, shape=shape).flush()
+        _dump_progress(progress_path, progress)
+    done = set(progress['done'])
+    pending = [block_num for block_num in range(len(blocks)) if block_num not in done]
+
+    start_time = time.time()
+    with multiprocessing.Pool(processes, initializer=_init_kernel_worker,
+                              initargs=(rows_vectors, None if symmetric else cols_vectors, dest, block_size)) as pool:
+        for i, block_num in enumerate(pool.imap_unordered(_compute_kernel_block,
+                                                          [(num, blocks[num]) for num in pending]), 1):
+            progress['done'].append(block_num)
+            _dump_progress(progress_path, progress)
+            if verbose:
+                elapsed_time = time.time() - start_time
+                print('\tBlocks: %d/%d, ETA: %s' % (len(progress['done']), len(blocks),
+                                                    timedelta(seconds=int(elapsed_time * (len(pending) - i) / i))))
+
+    os.remove(progress_path)
+    _dump_progress(fingerprint_path, {'fingerprint': fingerprint, 'shape': shape})
+    return np.load(dest, mmap_mode='r')
+
+
+def get_packed_index(row, col, size):
+    """
+    Return the position of the given cell of a symmetric matrix in its upper triangle, packed by rows. Rows and columns
+    can also be arrays (of the same shape, or broadcastable), then an array of positions is returned.
+
+    :type size: int
+    :param row: the row of the cell.
+    :param col: the column of the cell.
+    :param size: the number of rows (and columns) of the matrix.
+    :return: the position of the cell.
+    """
+    row, col = np.minimum(row, col), np.maximum(row, col)
+    return row * size - row * (row - 1) // 2 + col - row
+
+
+def unpack_upper_triangular(packed, dtype=np.float32):
+    """
+    Build the full symmetric matrix whose upper triangle is given, packed by rows (e.g. to train a classifier on a
+    precomputed kernel).
+
+    :param packed: the upper triangle of the matrix, packed by rows.
+    :param dtype: the type of the values of the matrix.
+    :return: a 2-D array.
+    """
+    size = _get_packed_size(packed)
+    matrix = np.empty((size, size), dtype=dtype)
+    for row in range(size):
+        start = get_packed_index(row, row, size)
+        matrix[row, row:] = packed[start:start + size - row]
+        matrix[row:, row] = matrix[row, row:]
+    return matrix
+
+
+def slice_packed_matrix(packed, rows, cols=None, dtype=np.float32):
+    """
+    Build the submatrix made of the given rows and columns of the symmetric matrix whose upper triangle is given,
+    packed by rows, reading only the cells needed (e.g. to train a classifier on a subset of the data the kernel was
+    computed for, without unpacking the whole matrix).
+
+    :type rows: list
+    :type cols: list
+    :param packed: the upper triangle of the matrix, packed by rows (possibly memory-mapped).
+    :param rows: the positions of the rows.
+    :param cols: the positions of the columns (if None, the same of rows).
+    :param dtype: the type of the values of the submatrix.
+    :return: a 2-D array.
+    """
+    size = _get_packed_size(packed)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = rows if cols is None else np.asarray(cols, dtype=np.int64)
+    matrix = np.empty((len(rows), len(cols)), dtype=dtype)
+    for start in range(0, len(rows), KERNEL_BLOCK_SIZE):
+        end = start + KERNEL_BLOCK_SIZE
+        matrix[start:end] = packed[get_packed_index(rows[start:end, np.newaxis], cols, size)]
+    return matrix
+
+
+""" UTILITY FUNCTIONS """
+
+_worker_rows_vectors = None
+_worker_cols_vectors = None
+_worker_kernel_matrix = None
+_worker_block_size = None
+
+
+def _init_kernel_worker(rows_vectors, cols_vectors, dest, block_size):
+    """
+    Store the occurrences vectors and map the kernel matrix shared by all the blocks of a worker process (if the
+    columns vectors are None, the matrix is symmetric).
+    """
+    global _worker_rows_vectors, _worker_cols_vectors, _worker_kernel_matrix, _worker_block_size
+    _worker_rows_vectors = rows_vectors
+    _worker_cols_vectors = cols_vectors
+    _worker_kernel_matrix = np.load(dest, mmap_mode='r+')
+    _worker_block_size = block_size
+
+
+def _compute_kernel_block(block):
+    """
+    Compute the given block of the kernel matrix and write it to the memory-mapped file (to be run in a worker
+    process).
+
+    :param block: a tuple made of the block number and the first row and column of the block.
+    :return: the block number, once the block has been written.
+    """
+    block_num, (row_start, col_start) = block
+    symmetric = _worker_cols_vectors is None
+    cols_vectors = _worker_rows_vectors if symmetric else _worker_cols_vectors
+    row_end = min(row_start + _worker_block_size, _worker_rows_vectors.shape[0])
+    col_end = min(col_start + _worker_block_size, cols_vectors.shape[0])
+    values = (_worker_rows_vectors[row_start:row_end] @ cols_vectors[col_start:col_end].T).toarray()
+
+    if symmetric:
+        # write the part of each row in the upper triangle, which is contiguous
+        size = _worker_rows_vectors.shape[0]
+        for row in range(row_start, min(row_end, col_end)):
+            first_col = max(row, col_start)
+            start = get_packed_index(row, first_col, size)
+            _worker_kernel_matrix[start:start + col_end - first_col] = values[row - row_start, first_col - col_start:]
+    else:
+        _worker_kernel_matrix[row_start:row_end, col_start:col_end] = values
+    _worker_kernel_matrix.flush()
+    return block_num
+
+
+def _traverse_mismatch_trie(symbols, shingles, mismatches, depth, weight, max_mismatches, alphabet_size,
+                            leaves_shingles, weights):
+    """
+    Traverse the subtree of the trie of the possible shingles rooted in the current node, collecting its leaves (see
+    get_mismatch_similarities()).
+
+    :param symbols: the symbols of each distinct shingle (a 2-D array).
+    :param shingles: the positions of the shingles that are still within the maximum number of mismatches.
+    :param mismatches: the number of mismatches of each of those shingles.
+    :type depth: int
+    :type weight: int
+    :param depth: the depth of the current node.
+    :param weight: the number of nodes the current node stands for.
+    :param max_mismatches: the maximum number of mismatching symbols.
+    :param alphabet_size: the number of symbols.
+    :type leaves_shingles: list
+    :type weights: list
+    :param leaves_shingles: the list where the shingles of each leaf are appended.
+    :param weights: the list where the weight of each leaf is appended.
+    """
+    if depth == symbols.shape[1]:
+        leaves_shingles.append(shingles)
+        weights.append(weight)
+        return
+
+    depth_symbols = symbols[shingles, depth]
+    occurring_symbols = np.unique(depth_symbols)
+    for symbol in occurring_symbols:
+        children_mismatches = mismatches + (depth_symbols != symbol)
+        alive = children_mismatches <= max_mismatches
+        _traverse_mismatch_trie(symbols, shingles[alive], children_mismatches[alive], depth + 1, weight,
+                                max_mismatches, alphabet_size, leaves_shingles, weights)
+
+    # all the other symbols are a mismatch for every shingle
+    others_num = alphabet_size - len(occurring_symbols)
+    alive = mismatches < max_mismatches
+    if others_num > 0 and alive.any():
+        _traverse_mismatch_trie(symbols, shingles[alive], mismatches[alive] + 1, depth + 1, weight * others_num,
+                                max_mismatches, alphabet_size, leaves_shingles, weights)
+
+
+def _get_vectors_fingerprint(*vectors):
+    """
+    Return the string that identifies the given occurrences vectors.
+
+    :param vectors: the sparse matrices (in CSR format).
+    :return: the fingerprint.
+    """
+    digest = hashlib.sha1()
+    for matrix in vectors:
+        for array in (matrix.indptr, matrix.indices, matrix.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(str(matrix.shape).encode())
+    return digest.hexdigest()
+
+
+def _get_packed_size(packed):
+    """
+    Return the number of rows (and columns) of the symmetric matrix whose upper triangle is given, packed by rows.
+
+    :param packed: the upper triangle of the matrix, packed by rows.
+    :return: the size of the matrix.
+    """
+    return int((np.sqrt(8 * len(packed) + 1) - 1) / 2)
+
+
+def _dump_progress(path, progress):
+    """
+    Store the progress (or the fingerprint, once complete) of a blocked computation, replacing the previous one at
+    once.
+
+    :type path: str
+    :type progress: dict
+    :param path: the path of the progress file.
+    :param progress: the progress.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as progress_file:
+        json.dump(progress, progress_file)
+    os.replace(tmp_path, path)
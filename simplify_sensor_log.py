@@ -1,11 +1,7 @@
 import os
 
-import unicodecsv as csv
-
-from utils.constants import DATA_FOLDER, LOG_ENTRY_DELIMITER, SENSOR_ID_POS
-
-SYMBOLS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U',
-           'V', 'W', 'X', 'Y', 'Z']
+from utils.constants import DATA_FOLDER, SENSOR_ID_POS
+from utils.pipeline import TranslateSymbolsStage, ProjectColumnsStage, LinesWriterStage, run_pipeline
 
 
 def simplify_sensor_log(sensor_log, readable=True):
@@ -22,29 +18,9 @@ def simplify_sensor_log(sensor_log, readable=True):
     file_basename = os.path.splitext(sensor_log.name)[0]
     dest = file_basename + '_simplified.txt'
     dest_dict = file_basename + '_simplified_dict.txt'
-    src_reader = csv.reader(sensor_log, delimiter=LOG_ENTRY_DELIMITER)
-    sensor_id_dict = {}
-
-    with open(dest, 'w') as simplified_log:
-        entry = next(src_reader, None)
-        while entry is not None:
-            sensor_id = entry[SENSOR_ID_POS]
-
-            if readable:
-                try:
-                    translation = sensor_id_dict[sensor_id]
-                except KeyError:
-                    translation = SYMBOLS[len(sensor_id_dict)]
-                    sensor_id_dict[sensor_id] = translation
-            else:
-                translation = sensor_id
-
-            simplified_log.write(translation + '\n')
-            entry = next(src_reader, None)
-
-    with open(dest_dict, 'w') as simplified_log_dict:
-        for k, v in sensor_id_dict.items():
-            simplified_log_dict.write('%s \t\t %s\n' % (v, k))
+    root = TranslateSymbolsStage(dest_dict, readable=readable)
+    root.then(ProjectColumnsStage([SENSOR_ID_POS])).then(LinesWriterStage(dest))
+    run_pipeline(sensor_log, root)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,33 @@
+import os
+
+from models.segmented_sensor_log import sweep_thresholds
+from models.topological_compat_matrix import TopologicalCompatMatrix
+from utils.constants import DATA_FOLDER
+
+if __name__ == '__main__':
+    import time
+    from datetime import timedelta
+
+    SRC = os.path.join(DATA_FOLDER, 'complete_dataset_preprocessed_filtered_simplified.txt')
+    SENSOR_ID_POS_ = 0
+    COMPAT_THRESHOLDS = [0.05 * i for i in range(1, 11)]
+    NOISE_THRESHOLDS = [1, 2, 3, 4, 5]
+    PROCESSES = None  # use all CPUs
+
+    start_time = time.time()
+
+    print('Building topological compatibility matrix...')
+    tcm = TopologicalCompatMatrix.from_file(SRC, sensor_id_pos=SENSOR_ID_POS_)
+
+    print('Performing log segmentations...')
+    thresholds = [(compat, noise) for compat in COMPAT_THRESHOLDS for noise in NOISE_THRESHOLDS]
+    with open(SRC, 'rb') as log:
+        table = sweep_thresholds(log, tcm, thresholds, sensor_id_pos=SENSOR_ID_POS_, processes=PROCESSES)
+
+    elapsed_time = (time.time() - start_time)
+    print('Sweep time:', timedelta(seconds=elapsed_time))
+
+    print('compat  noise  segments  min  max     avg  median  b-steps')
+    for row in table:
+        print('{compat_threshold:6.2f}  {noise_threshold:5d}  {segments_num:8d}  {min_length:3d}  {max_length:3d}  '
+              '{avg_length:6.1f}  {median_length:6.1f}  {b_steps_num:7d}'.format(**row))
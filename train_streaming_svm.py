@@ -0,0 +1,72 @@
+import os
+from datetime import timedelta
+
+from sklearn.externals import joblib
+import time
+
+from sequence_classification.one_class_svm import StreamingOneClassSVM, LinearSpectrumScorer
+from sequence_classification.sequence_classifier_input import SequenceClassifierInput
+from utils.constants import TRAINED_MODELS_FOLDER, PICKLE_EXT, NPZ_EXT, FILENAME_SEPARATOR
+from utils.dataset_management import filter_dataset
+
+
+if __name__ == '__main__':
+
+    NOISE_THRESHOLD = 15
+    NU = 0.5
+    BATCH_SIZE = 1000
+    EPOCHS_NUM = 5
+    KERNEL_MODEL = 'l_min_15'  # the kernel One-class SVM to be compared with (see train_svm.py)
+
+    print('Loading dataset...')
+    clf_input = SequenceClassifierInput(cached_dataset='1498483802_3_17732_GOOD_training')
+    train_data, test_data, *_ = clf_input.get_spectrum_train_test_data()  # ignoring labels
+
+    # SequenceClassifierInput splits the dataset in train and test by default.
+    # Since the validation is performed separately, we join the splits.
+    train_data = train_data + test_data
+
+    # Filter out short sequences from dataset.
+    print('Filtering dataset...')
+    filter_dataset(train_data, NOISE_THRESHOLD, clf_input.ngrams_length)
+
+    # New data (e.g. the segments of a day) can be folded in later by calling partial_fit() on the loaded model.
+    print('Training streaming One-class SVM...')
+    clf = StreamingOneClassSVM(clf_input.ngrams_length, nu=NU, random_state=clf_input.random_state)
+    start_time = time.time()
+    clf.fit(train_data, batch_size=BATCH_SIZE, epochs_num=EPOCHS_NUM)
+    elapsed_time = (time.time() - start_time)
+    print('\tTime:', timedelta(seconds=elapsed_time))
+    print('\tNoise threshold:', NOISE_THRESHOLD)
+    print('\tNu:', NU)
+
+    print('Creating model dump...')
+    model_checkpoint_time = str(int(time.time()))
+    model_checkpoint_filename = os.path.join(TRAINED_MODELS_FOLDER,
+                                             FILENAME_SEPARATOR.join([model_checkpoint_time, 'streaming']) + PICKLE_EXT)
+    joblib.dump(clf, model_checkpoint_filename)
+    print(model_checkpoint_filename)
+
+    print('Loading kernel model...')
+    try:
+        kernel_clf = LinearSpectrumScorer.load(os.path.join(TRAINED_MODELS_FOLDER, KERNEL_MODEL + NPZ_EXT))
+    except FileNotFoundError:
+        kernel_clf = joblib.load(os.path.join(TRAINED_MODELS_FOLDER, KERNEL_MODEL + PICKLE_EXT))
+
+    print('Loading validation data...')
+    clf_input = SequenceClassifierInput(cached_dataset='1498490206_3_28519_GOOD_validation')
+    train_data, test_data, *_ = clf_input.get_spectrum_train_test_data()  # ignoring labels
+    validation_data = train_data + test_data
+    filter_dataset(validation_data, NOISE_THRESHOLD, clf_input.ngrams_length)
+    print('\tFiltered dataset size:', str(len(validation_data)))
+
+    # compare the predictions of the two models
+    print('Computing predictions...')
+    predictions = clf.predict(validation_data)
+    kernel_predictions = kernel_clf.predict(validation_data)
+    total_sequences_num = len(validation_data)
+    print('\tFraction of good sequences: {:3.1f}% (kernel model: {:3.1f}%)'.format(
+        (predictions == 1).sum() / total_sequences_num * 100,
+        (kernel_predictions == 1).sum() / total_sequences_num * 100))
+    print('\tAgreement with kernel model: {:3.1f}%'.format(
+        (predictions == kernel_predictions).sum() / total_sequences_num * 100))
@@ -1,19 +1,20 @@
 import os
 from datetime import timedelta
 
-from sklearn import svm
 from sklearn.externals import joblib
 import time
 
-from sequence_classification.spectrum_kernel import occurrence_dict_spectrum_kernel
+from sequence_classification.one_class_svm import PrecomputedOneClassSVM
 from sequence_classification.sequence_classifier_input import SequenceClassifierInput
+from sequence_classification.spectrum_kernel import slice_packed_matrix
 from utils.constants import TRAINED_MODELS_FOLDER, PICKLE_EXT
-from utils.dataset_management import filter_dataset
+from utils.dataset_management import get_filtered_indices
 
 
 if __name__ == '__main__':
 
     NOISE_THRESHOLD = 10
+    NU = 0.5
 
     print('Loading dataset...')
     clf_input = SequenceClassifierInput(cached_dataset='1498483802_3_17732_GOOD_training')
@@ -23,17 +24,27 @@ if __name__ == '__main__':
     # Since the validation is performed separately, we join the splits.
     train_data = train_data + test_data
 
+    # The kernel matrix of the whole dataset is computed once and stored next to the dataset dump,
+    # then models with different parameters are trained by slicing it.
+    print('Loading kernel matrix...')
+    start_time = time.time()
+    gram_matrix = clf_input.get_spectrum_gram_matrix(train_data)
+    print('\tTime:', timedelta(seconds=time.time() - start_time))
+
     # Filter out short sequences from dataset.
     print('Filtering dataset...')
-    filter_dataset(train_data, NOISE_THRESHOLD, clf_input.ngrams_length)
+    kept_indices = get_filtered_indices(train_data, NOISE_THRESHOLD, clf_input.ngrams_length)
+    train_data = [train_data[i] for i in kept_indices]
 
     print('Training One-class SVM...')
-    clf = svm.OneClassSVM(kernel=occurrence_dict_spectrum_kernel)
+    clf = PrecomputedOneClassSVM(nu=NU)
     start_time = time.time()
-    clf.fit(train_data)
+    clf.fit(slice_packed_matrix(gram_matrix, kept_indices), train_data)
     elapsed_time = (time.time() - start_time)
     print('\tTime:', timedelta(seconds=elapsed_time))
     print('\tNoise threshold:', NOISE_THRESHOLD)
+    print('\tNu:', NU)
+    print('\tSupport vectors:', len(clf.support_vectors))
 
     print('Creating model dump...')
     model_checkpoint_time = str(int(time.time()))
@@ -0,0 +1,17 @@
+import os
+
+from models.columnar_sensor_log import ColumnarSensorLog
+from utils.constants import DATA_FOLDER
+
+if __name__ == '__main__':
+    import time
+    from datetime import timedelta
+
+    SRC = os.path.join(DATA_FOLDER, 'dataset_attivita_non_innestate_filtered.tsv')
+
+    start_time = time.time()
+    with open(SRC, 'rb') as log:
+        columnar_log = ColumnarSensorLog.from_tsv(log)
+    print(columnar_log.path)
+    print('events:', len(columnar_log), ' sensors:', len(columnar_log.sensors))
+    print('Conversion time:', timedelta(seconds=time.time() - start_time))
@@ -1,8 +1,7 @@
 import os
 
-import unicodecsv as csv
-
-from utils.constants import DATA_FOLDER, LOG_ENTRY_DELIMITER
+from utils.constants import DATA_FOLDER, DATE_POS, TIME_POS, SENSOR_ID_POS
+from utils.pipeline import ProjectColumnsStage, CsvWriterStage, run_pipeline
 
 
 def convert_to_csv(sensor_log):
@@ -13,15 +12,9 @@ def convert_to_csv(sensor_log):
     :param sensor_log: the tab-separated file containing the sensor log.
     """
     dest = os.path.splitext(sensor_log.name)[0] + '.csv'
-    src_reader = csv.reader(sensor_log, delimiter=LOG_ENTRY_DELIMITER)
-
-    with open(dest, 'wb') as csv_log:
-        dest_writer = csv.writer(csv_log, delimiter=',')
-
-        entry = next(src_reader, None)
-        while entry is not None:
-            dest_writer.writerow(entry[:3])  # retain only: day, timestamp, sensor_id
-            entry = next(src_reader, None)
+    root = ProjectColumnsStage([DATE_POS, TIME_POS, SENSOR_ID_POS])  # retain only: day, timestamp, sensor_id
+    root.then(CsvWriterStage(dest, delimiter=','))
+    run_pipeline(sensor_log, root)
 
 
 if __name__ == '__main__':
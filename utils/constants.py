@@ -4,22 +4,60 @@ import os
 DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 DATABASE = os.path.join(DATA_FOLDER, '')  # add .db file in data/ if needed
 LOG_EXT = '.tsv'
+COLUMNAR_EXT = '.cols'
 LOG_ENTRY_DELIMITER = '\t'
+DATE_POS = 0
+TIME_POS = 1
 SENSOR_ID_POS = 2
 SENSOR_STATE_POS = 3
 SENSOR_STATE_ON = 'ON'
 NOISE_THRESHOLD = 2
+TCM_CACHE_FOLDER = os.path.join(DATA_FOLDER, 'tcm_cache')
+BENCHMARKS_FOLDER = os.path.join(DATA_FOLDER, 'benchmarks')
 
 TRAINED_MODELS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'trained_classifiers')
 TF_MODEL_EXT = '.ckpt'
 IMG_EXT = '.png'
 PADDING_VALUE = 0
 
+BASE_TWO = 2
+SYMBOLS_DICT = {
+    'A': '00000',
+    'B': '00001',
+    'C': '00010',
+    'D': '00011',
+    'E': '00100',
+    'F': '00101',
+    'G': '00110',
+    'H': '00111',
+    'I': '01000',
+    'J': '01001',
+    'K': '01010',
+    'L': '01011',
+    'M': '01100',
+    'N': '01101',
+    'O': '01110',
+    'P': '01111',
+    'Q': '10000',
+    'R': '10001',
+    'S': '10010',
+    'T': '10011',
+    'U': '10100',
+    'V': '10101',
+    'W': '10110',
+    'X': '10111',
+    'Y': '11000',
+    'Z': '11001'
+}
+SYMBOL_BITS = len(next(iter(SYMBOLS_DICT.values())))  # the bits encoding each symbol of an n-gram
+ALPHABET_SIZE = len(SYMBOLS_DICT)
+
 FILENAME_SEPARATOR = '_'
 RNN_SUFFIX = 'rnn'
 SPECTRUM_SUFFIX = 'spectrum'
 GLOVE_TRAIN_SUFFIX = 'glove_matrix_train.mmap'
 GLOVE_TEST_SUFFIX = 'glove_matrix_test.mmap'
+GRAM_SUFFIX = 'gram'
 
 SPECTRUM_KEY = 'spectrum'
 LABELS_KEY = 'labels'
@@ -38,3 +76,6 @@ TRAIN_LABELS_POS = 2
 TEST_LABELS_POS = 3
 
 PICKLE_EXT = '.pkl'
+NPZ_EXT = '.npz'
+NPY_EXT = '.npy'
+JSON_EXT = '.json'
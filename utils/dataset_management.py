@@ -9,6 +9,20 @@ def filter_dataset(dataset, threshold, ngrams_length):
     dataset[:] = [sequence for sequence in dataset if _get_actual_sequence_length(sequence, ngrams_length) >= threshold]
 
 
+def get_filtered_indices(dataset, threshold, ngrams_length):
+    """
+    Return the positions of the sequences of the dataset that match the minimum length (expressed by threshold), i.e.
+    the ones kept by filter_dataset() (e.g. to slice a kernel matrix computed for the whole dataset).
+
+    :param dataset: the dataset containing sequences n-grams representations.
+    :param threshold: the minimum length to be matched.
+    :param ngrams_length: the length of each n-gram.
+    :return: the list of positions.
+    """
+    return [i for i, sequence in enumerate(dataset)
+            if _get_actual_sequence_length(sequence, ngrams_length) >= threshold]
+
+
 def _get_actual_sequence_length(sequence, ngrams_length):
     """
     Compute the length of a sequence given its n-grams representation and n-grams length.
@@ -1,4 +1,9 @@
 import os
+from collections import deque
+
+import unicodecsv as csv
+
+from utils.constants import LOG_ENTRY_DELIMITER
 
 
 def unique_filename(filename):
@@ -12,3 +17,25 @@ def unique_filename(filename):
             pass
         filename = file_name_parts[0] + '_' + str(counter) + file_name_parts[1]
         counter += 1
+
+
+def iter_entries_with_offsets(sensor_log):
+    """
+    Iterate over the entries of the given sensor log, together with their byte offsets.
+
+    :type sensor_log: file
+    :param sensor_log: the tab-separated file containing the sensor log (opened in binary mode).
+    :return: a generator of tuples made of the byte offset and the log entry.
+    """
+    lines_offsets = deque()  # the offsets of the lines read by the csv reader and not yet assigned to an entry
+
+    def iter_lines():
+        offset = sensor_log.tell()
+        for line in sensor_log:
+            lines_offsets.append(offset)
+            offset += len(line)
+            yield line
+
+    for entry in csv.reader(iter_lines(), delimiter=LOG_ENTRY_DELIMITER):
+        yield lines_offsets.popleft(), entry
+        lines_offsets.clear()  # an entry may span many lines (e.g. quoted new lines)
@@ -0,0 +1,221 @@
+""" Module containing the stages of the streaming pipeline that prepares the sensor logs (see prepare_sensor_log.py). """
+import unicodecsv as csv
+
+from utils.constants import LOG_ENTRY_DELIMITER, SENSOR_ID_POS, SENSOR_STATE_POS, SENSOR_STATE_ON
+
+SYMBOLS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U',
+           'V', 'W', 'X', 'Y', 'Z']
+
+
+class Stage(object):
+
+    def __init__(self):
+        """
+        Stage of a streaming pipeline, that transforms each log entry and feeds the result to the following stages.
+        A stage can be followed by many stages, so that a single pass over the source feeds many outputs at once.
+        The base stage leaves the entries as they are (e.g. to be used as the root of the pipeline).
+        """
+        self._next_stages = []
+
+    def then(self, stage):
+        """
+        Add the given stage after this one.
+
+        :type stage: Stage
+        :param stage: the following stage.
+        :return: the given stage, so that chains of stages can be built.
+        """
+        self._next_stages.append(stage)
+        return stage
+
+    def feed(self, entry):
+        """
+        Transform the given log entry and feed the result to the following stages (unless it is discarded).
+
+        :type entry: list
+        :param entry: the log entry.
+        """
+        entry = self.transform(entry)
+        if entry is not None:
+            for stage in self._next_stages:
+                stage.feed(entry)
+
+    def transform(self, entry):
+        """
+        Transform the given log entry.
+
+        :type entry: list
+        :param entry: the log entry.
+        :return: the transformed entry, None if it has to be discarded.
+        """
+        return entry
+
+    def close(self):
+        """
+        Finalize this stage and the following ones, once the source is over.
+        """
+        for stage in self._next_stages:
+            stage.close()
+
+
+class NormalizeStage(Stage):
+    DELIMITER = '|'  # the delimiter of the fields of the complete sensor log
+    DATE_TIME_POS = 0
+    SENSOR_ID_POS = 2
+    SENSOR_STATE_POS = 3
+    TIME_ZONE_LENGTH = 3
+
+    def transform(self, entry):
+        """
+        Convert an entry of the complete sensor log to the standard form used in the project, i.e. date, time (without
+        time zone), sensor id and state.
+        """
+        date_time = str(entry[self.DATE_TIME_POS]).strip().split()
+        date = date_time[0]
+        time = date_time[1][:-self.TIME_ZONE_LENGTH]  # trim time zone
+
+        sensor_id = str(entry[self.SENSOR_ID_POS]).strip()
+        sensor_state = str(entry[self.SENSOR_STATE_POS]).strip()
+        return [date, time, sensor_id, sensor_state]
+
+
+class FilterStateStage(Stage):
+
+    def __init__(self, state=SENSOR_STATE_ON, state_pos=SENSOR_STATE_POS):
+        """
+        Stage that discards the entries whose sensor is not in the given state (e.g. the ones related to a reset).
+
+        :type state: str
+        :type state_pos: int
+        :param state: the state to be kept.
+        :param state_pos: the position of the sensor state in the log entry.
+        """
+        super(FilterStateStage, self).__init__()
+        self.state = state
+        self.state_pos = state_pos
+
+    def transform(self, entry):
+        return entry if entry[self.state_pos] == self.state else None
+
+
+class TranslateSymbolsStage(Stage):
+
+    def __init__(self, dest_dict=None, readable=True, sensor_id_pos=SENSOR_ID_POS):
+        """
+        Stage that translates the sensor ids to symbols, such that sequence classification techniques can be applied.
+        Notice that, for the sake of readability, we allows only for a maximum number of distinct symbols equals to the
+        size of English alphabet. The mapping between sensor ids and letters is computed in order of appearance and
+        written to the given file at the end.
+
+        :type dest_dict: str
+        :type readable: bool
+        :type sensor_id_pos: int
+        :param dest_dict: the path of the file where the mapping is written (if None, it is not written).
+        :param readable: whether the sensor ids have to be translated or not.
+        :param sensor_id_pos: the position of the sensor id in the log entry.
+        """
+        super(TranslateSymbolsStage, self).__init__()
+        self.dest_dict = dest_dict
+        self.readable = readable
+        self.sensor_id_pos = sensor_id_pos
+        self.sensor_id_dict = {}
+
+    def transform(self, entry):
+        if not self.readable:
+            return entry
+        sensor_id = entry[self.sensor_id_pos]
+        try:
+            translation = self.sensor_id_dict[sensor_id]
+        except KeyError:
+            translation = SYMBOLS[len(self.sensor_id_dict)]
+            self.sensor_id_dict[sensor_id] = translation
+        entry = list(entry)
+        entry[self.sensor_id_pos] = translation
+        return entry
+
+    def close(self):
+        if self.dest_dict:
+            with open(self.dest_dict, 'w') as simplified_log_dict:
+                for k, v in self.sensor_id_dict.items():
+                    simplified_log_dict.write('%s \t\t %s\n' % (v, k))
+        super(TranslateSymbolsStage, self).close()
+
+
+class ProjectColumnsStage(Stage):
+
+    def __init__(self, positions):
+        """
+        Stage that retains only the given columns of each entry.
+
+        :type positions: list
+        :param positions: the positions of the columns to be retained, in the order they have to appear.
+        """
+        super(ProjectColumnsStage, self).__init__()
+        self.positions = positions
+
+    def transform(self, entry):
+        return [entry[pos] for pos in self.positions]
+
+
+class CsvWriterStage(Stage):
+
+    def __init__(self, dest, delimiter=LOG_ENTRY_DELIMITER):
+        """
+        Final stage that writes each entry to the given delimiter-separated file.
+
+        :type dest: str
+        :type delimiter: str
+        :param dest: the path of the file.
+        :param delimiter: the delimiter of the fields.
+        """
+        super(CsvWriterStage, self).__init__()
+        self._dest_file = open(dest, 'wb')
+        self._dest_writer = csv.writer(self._dest_file, delimiter=delimiter)
+
+    def transform(self, entry):
+        self._dest_writer.writerow(entry)
+        return entry
+
+    def close(self):
+        self._dest_file.close()
+        super(CsvWriterStage, self).close()
+
+
+class LinesWriterStage(Stage):
+
+    def __init__(self, dest):
+        """
+        Final stage that writes each entry (made of a single field) to the given text file, one per line.
+
+        :type dest: str
+        :param dest: the path of the file.
+        """
+        super(LinesWriterStage, self).__init__()
+        self._dest_file = open(dest, 'w')
+
+    def transform(self, entry):
+        self._dest_file.write(entry[0] + '\n')
+        return entry
+
+    def close(self):
+        self._dest_file.close()
+        super(LinesWriterStage, self).close()
+
+
+def run_pipeline(sensor_log, root, delimiter=LOG_ENTRY_DELIMITER):
+    """
+    Feed each entry of the given sensor log to the given stage, reading the log only once.
+    All the stages are closed at the end, even if the pipeline fails.
+
+    :type sensor_log: file
+    :type root: Stage
+    :type delimiter: str
+    :param sensor_log: the delimiter-separated file containing the sensor log.
+    :param root: the first stage of the pipeline.
+    :param delimiter: the delimiter of the fields of the sensor log.
+    """
+    try:
+        for entry in csv.reader(sensor_log, delimiter=delimiter):
+            root.feed(entry)
+    finally:
+        root.close()
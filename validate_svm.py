@@ -7,17 +7,23 @@ from datetime import timedelta
 
 from sklearn.externals import joblib
 
+from sequence_classification.one_class_svm import LinearSpectrumScorer
 from sequence_classification.sequence_classifier_input import SequenceClassifierInput
 from utils.dataset_management import filter_dataset
-from utils.constants import TRAINED_MODELS_FOLDER, PICKLE_EXT, DATA_FOLDER, FILENAME_SEPARATOR
+from utils.constants import TRAINED_MODELS_FOLDER, PICKLE_EXT, DATA_FOLDER, FILENAME_SEPARATOR, NPZ_EXT
 
 if __name__ == '__main__':
 
     NOISE_THRESHOLD = 15
 
-    print('Loading model dump...')
-    predictions_filename = os.path.join(TRAINED_MODELS_FOLDER, 'l_min_15.pkl')
-    clf = joblib.load(predictions_filename)
+    # the compiled model (see compile_svm.py) is used if available, since it gives the same predictions faster
+    try:
+        print('Loading compiled model...')
+        clf = LinearSpectrumScorer.load(os.path.join(TRAINED_MODELS_FOLDER, 'l_min_15' + NPZ_EXT))
+    except FileNotFoundError:
+        print('Loading model dump...')
+        predictions_filename = os.path.join(TRAINED_MODELS_FOLDER, 'l_min_15' + PICKLE_EXT)
+        clf = joblib.load(predictions_filename)
 
     print('Loading validation data...')
     clf_input = SequenceClassifierInput(cached_dataset='1498490206_3_28519_GOOD_validation')